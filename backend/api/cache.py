@@ -0,0 +1,161 @@
+from functools import wraps
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+
+from recipes.models import Recipe
+from recipes.versions import get_versions
+
+HITS_KEY = 'recipes:hits'
+MISSES_KEY = 'recipes:misses'
+CACHED_QUERY_PARAMS = (
+    'author', 'cursor', 'limit', 'ordering', 'page', 'search', 'tags'
+)
+# Меняются с каждым нажатием «в избранное» и «в покупки»: в кеше их
+# нет, в ответ из кеша они читаются из БД.
+COUNTER_FIELDS = ('favorites_count', 'shopping_cart_count')
+
+
+def count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_stats():
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
+
+
+def recipe_versions(request, kwargs):
+    """Данные, от которых зависит ответ о рецептах.
+
+    Страница рецепта – только от своей версии, списки – от общей версии
+    списков. Справочники тэгов и ингредиентов входят во все ответы,
+    отметки пользователя (избранное, покупки, подписки) – в его ответы.
+    """
+    names = ['tags', 'ingredients']
+    if 'pk' in kwargs:
+        names.append(f'recipe:{kwargs["pk"]}')
+    else:
+        names.append('recipes')
+    if request.user.is_authenticated:
+        names.append(f'user:{request.user.pk}')
+    return names
+
+
+def get_key(request, kwargs):
+    params = sorted(
+        (name, value)
+        for name in CACHED_QUERY_PARAMS
+        for value in request.query_params.getlist(name)
+    )
+    versions = '.'.join(map(str, get_versions(
+        recipe_versions(request, kwargs)
+    )))
+    return (
+        f'recipes:{versions}:{request.get_host()}:'
+        f'{request.path}?{urlencode(params)}'
+    )
+
+
+def recipes_in(data):
+    return data['results'] if 'results' in data else [data]
+
+
+def without_counters(data):
+    def strip(recipe):
+        return {
+            name: value for name, value in recipe.items()
+            if name not in COUNTER_FIELDS
+        }
+
+    if 'results' in data:
+        return {**data, 'results': [strip(item) for item in data['results']]}
+    return strip(data)
+
+
+def add_counters(data):
+    recipes = recipes_in(data)
+    counters = {
+        pk: values for pk, *values in Recipe.objects.filter(
+            id__in=[recipe['id'] for recipe in recipes]
+        ).values_list('id', *COUNTER_FIELDS)
+    }
+    for recipe in recipes:
+        recipe.update(zip(COUNTER_FIELDS, counters.get(recipe['id'], ())))
+    return data
+
+
+def cached_response(view_method):
+    """Кеширует ответы анонимным пользователям по версиям данных."""
+
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view_method(view, request, *args, **kwargs)
+        key = get_key(request, kwargs)
+        data = cache.get(key)
+        if data is not None:
+            count(HITS_KEY)
+            response = Response(add_counters(data))
+            response['X-Cache'] = 'HIT'
+            return response
+        count(MISSES_KEY)
+        response = view_method(view, request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(
+                key, without_counters(response.data),
+                settings.RECIPE_CACHE_TIMEOUT,
+            )
+        response['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+def conditional(*names):
+    """Отвечает 304 по If-None-Match до сериализации.
+
+    Last-Modified не отдаётся: в нём только секунды, и изменение в ту же
+    секунду, что и If-Modified-Since клиента, дало бы устаревший 304.
+    ETag строится из версий перечисленных данных, пользователя
+    и адреса запроса. Вместо имени можно передать функцию (запрос,
+    kwargs) -> имена. Счётчики избранного и покупок в версии не входят,
+    поэтому в ответе 304 они могут отставать.
+    """
+
+    def decorator(view_method):
+
+        @wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            versions = get_versions([
+                name
+                for item in names
+                for name in (
+                    item(request, kwargs) if callable(item) else (item,)
+                )
+            ])
+            etag = quote_etag(md5(
+                f'{versions}:{request.user.pk}:{request.get_host()}'
+                f'{request.get_full_path()}'.encode()
+            ).hexdigest())
+            response = get_conditional_response(
+                request, etag=etag
+            ) or view_method(view, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+            patch_vary_headers(response, ('Authorization', 'Cookie'))
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,28 +1,50 @@
+from django.conf import settings
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes import reference
+from recipes.autocomplete import autocomplete
+from recipes.models import Ingredient, Recipe
 
 
 class IngredientFilter(FilterSet):
 
-    name = filters.CharFilter(lookup_expr='icontains')
+    name = filters.CharFilter(method='get_autocomplete')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def get_autocomplete(self, queryset, name, value):
+        return autocomplete(
+            queryset, value, settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        )
+
+
+# Порядок выдачи рецептов по значению ?ordering=, его же берёт курсор.
+RECIPE_ORDERINGS = {
+    'trending': ('-trending_score', '-id'),
+}
+
+
+def tag_choices():
+    return [(tag.slug, tag.name) for tag in reference.tags.all()]
+
 
 class RecipeFilter(FilterSet):
 
-    tags = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='get_tags',
     )
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('trending', 'Популярные за последнее время'),),
+        method='get_ordering',
+    )
 
     class Meta:
         model = Recipe
@@ -40,3 +62,17 @@ class RecipeFilter(FilterSet):
         if self.request.user.is_authenticated and value:
             return queryset.filter(shoppingcart__user=self.request.user)
         return queryset
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        tags = reference.tags.in_bulk(value, field='slug')
+        return queryset.filter(
+            tags__in=[tag.id for tag in tags.values()]
+        ).distinct()
+
+    def get_search(self, queryset, name, value):
+        return queryset.search(value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
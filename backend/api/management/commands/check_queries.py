@@ -0,0 +1,116 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.query_budgets import CASES, METRICS_TOKEN, Fixture, measure
+from recipes.models import (
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+)
+from users.models import Follow
+
+# Таблицы, где последовательное чтение при росте данных недопустимо.
+WATCHED_TABLES = {
+    model._meta.db_table
+    for model in (Recipe, RecipeIngredient, Favorite, ShoppingCart, Follow)
+}
+SNAPSHOT = Path(settings.BASE_DIR) / 'api' / 'query_plans.json'
+
+
+def seq_scans(node):
+    tables = set()
+    if node.get('Node Type') == 'Seq Scan':
+        tables.add(node['Relation Name'])
+    for child in node.get('Plans', ()):
+        tables |= seq_scans(child)
+    return tables
+
+
+def explain(queries):
+    """Таблицы, которые читаются целиком, даже когда планировщику
+    запрещено последовательное чтение: индекса для них нет."""
+    tables = set()
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        for query in queries:
+            if not query['sql'].lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {query["sql"]}')
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            tables |= seq_scans(plan[0]['Plan'])
+    return tables & WATCHED_TABLES
+
+
+class Command(BaseCommand):
+    help = ('Планы запросов маршрутов api.urls на PostgreSQL: новые '
+            'последовательные чтения таблиц рецептов, избранного, списков '
+            'покупок и подписок сверяются со снимком планов. Бюджеты '
+            'числа запросов проверяют тесты api. Запуск: python manage.py '
+            'check_queries [--update-snapshot]')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--update-snapshot',
+            action='store_true',
+            help=f'Записать найденные последовательные чтения в {SNAPSHOT}.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Планы запросов проверяются на PostgreSQL.')
+        if not SNAPSHOT.exists() and not options['update_snapshot']:
+            raise CommandError(
+                f'Нет снимка планов {SNAPSHOT.name}: снимите его '
+                f'с --update-snapshot.'
+            )
+        snapshot = {}
+        if SNAPSHOT.exists():
+            snapshot = json.loads(SNAPSHOT.read_text())
+        problems, plans = [], {}
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'check-queries',
+        }}, METRICS_TOKEN=METRICS_TOKEN), transaction.atomic():
+            fixture = Fixture()
+            anonymous = APIClient()
+            client = APIClient()
+            client.force_authenticate(fixture.user)
+            for case in CASES:
+                scans = set()
+                for size in case.sizes:
+                    measure(
+                        anonymous if case.anonymous else client,
+                        case, fixture, size,
+                        lambda queries: scans.update(explain(queries)),
+                    )
+                new_scans = scans - set(snapshot.get(case.key, ()))
+                if new_scans and not options['update_snapshot']:
+                    problems.append(
+                        f'{case.key}: последовательное чтение '
+                        f'{", ".join(sorted(new_scans))}'
+                    )
+                plans[case.key] = sorted(scans)
+                self.stdout.write(
+                    f'{case.key:<45} {", ".join(sorted(scans)) or "-"}'
+                )
+            transaction.set_rollback(True)
+        if options['update_snapshot']:
+            SNAPSHOT.write_text(json.dumps(
+                {key: tables for key, tables in plans.items() if tables},
+                ensure_ascii=False, indent=2, sort_keys=True,
+            ) + '\n')
+            self.stdout.write(f'Снимок планов записан в {SNAPSHOT}.')
+        if problems:
+            raise CommandError('\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS(
+            'Новых последовательных чтений нет.'
+        ))
@@ -0,0 +1,179 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+
+TIME_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Время и число запросов к БД, время сериализаторов и рендера
+    одного HTTP-запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0
+        self.serializer = 0
+        self.serializing = False
+        self.render = 0
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+
+class TimedSerializerMixin:
+    """Примесь к сериализатору DRF: время to_representation без
+    запросов к БД идёт в статистику текущего запроса. Вложенные
+    сериализаторы с этой же примесью дважды не считаются."""
+
+    def to_representation(self, instance):
+        stats = current.get()
+        if stats is None or stats.serializing:
+            return super().to_representation(instance)
+        stats.serializing = True
+        db, start = stats.db, time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer += (
+                time.perf_counter() - start - (stats.db - db)
+            )
+            stats.serializing = False
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0, 0]
+        counts = series[0]
+        position = bisect_left(self.buckets, value)
+        if position < len(counts):
+            counts[position] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, label_names):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            labels = ','.join(
+                f'{name}="{escape(value)}"'
+                for name, value in zip(label_names, labels)
+            )
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                yield (
+                    f'{self.name}_bucket{{{labels},le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            yield f'{self.name}_bucket{{{labels},le="+Inf"}} {count}'
+            yield f'{self.name}_sum{{{labels}}} {total}'
+            yield f'{self.name}_count{{{labels}}} {count}'
+
+
+def render_counter(name, documentation, value):
+    return (
+        f'# HELP {name} {documentation}\n'
+        f'# TYPE {name} counter\n'
+        f'{name} {value}\n'
+    )
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n'
+    )
+
+
+class Registry:
+    """Гистограммы по маршрутам DRF в памяти процесса.
+
+    У каждого воркера gunicorn свой реестр, и /api/_metrics отдаёт
+    данные того воркера, что принял запрос сборщика. Сводную картину
+    даёт сумма по воркерам, поэтому метрики стоит смотреть при одном
+    воркере или как долю замеров, а не как полный счёт запросов.
+    """
+
+    label_names = ('route', 'method')
+
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = {}
+        self.histograms = {
+            'duration': Histogram(
+                'http_request_duration_seconds',
+                'Полное время обработки запроса.',
+                TIME_BUCKETS,
+            ),
+            'db': Histogram(
+                'http_request_db_seconds',
+                'Время запросов к БД.',
+                TIME_BUCKETS,
+            ),
+            'serializer': Histogram(
+                'http_request_serializer_seconds',
+                'Время сериализаторов DRF без запросов к БД.',
+                TIME_BUCKETS,
+            ),
+            'render': Histogram(
+                'http_request_render_seconds',
+                'Время рендера ответа DRF.',
+                TIME_BUCKETS,
+            ),
+            'queries': Histogram(
+                'http_request_db_queries',
+                'Число запросов к БД.',
+                QUERY_BUCKETS,
+            ),
+        }
+
+    def record(self, route, method, status, stats, duration):
+        labels = (route, method)
+        with self.lock:
+            key = (route, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.histograms['duration'].observe(labels, duration)
+            self.histograms['db'].observe(labels, stats.db)
+            self.histograms['serializer'].observe(labels, stats.serializer)
+            self.histograms['render'].observe(labels, stats.render)
+            self.histograms['queries'].observe(labels, stats.queries)
+
+    def render(self):
+        with self.lock:
+            lines = [
+                '# HELP http_requests_total Число обработанных запросов.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (route, method, status), count in sorted(
+                self.requests.items()
+            ):
+                lines.append(
+                    f'http_requests_total{{route="{escape(route)}",'
+                    f'method="{method}",status="{status}"}} {count}'
+                )
+            for histogram in self.histograms.values():
+                lines.extend(histogram.render(self.label_names))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
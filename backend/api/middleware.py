@@ -0,0 +1,83 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from api.metrics import RequestStats, current, registry
+
+
+class MetricsMiddleware:
+    """Время, число и длительность запросов к БД, время сериализаторов
+    и рендера ответа по маршрутам DRF.
+
+    Замеряется доля METRICS_SAMPLE_RATE запросов: они попадают в
+    гистограммы /api/_metrics и получают заголовок Server-Timing.
+    Сериализаторы учитываются, если в них есть TimedSerializerMixin.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        stats = RequestStats()
+        token = current.set(stats)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats.execute):
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, response.streaming_content, stats, start
+            )
+            return response
+        duration = time.perf_counter() - start
+        self.record(request, response, stats, duration)
+        app = duration - stats.db - stats.serializer - stats.render
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.db * 1000:.1f};desc="{stats.queries} queries"',
+            f'serializer;dur={stats.serializer * 1000:.1f}',
+            f'render;dur={stats.render * 1000:.1f}',
+            f'app;dur={max(app, 0) * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        return response
+
+    def process_template_response(self, request, response):
+        stats = current.get()
+        if stats is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                stats.render += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def stream(self, request, response, content, stats, start):
+        """Тело потокового ответа читается после выхода из middleware:
+        запросы и время учитываются, когда поток закончится. Заголовки
+        к этому моменту уже отправлены, поэтому Server-Timing у таких
+        ответов нет."""
+        try:
+            with connection.execute_wrapper(stats.execute):
+                yield from content
+        finally:
+            self.record(
+                request, response, stats, time.perf_counter() - start
+            )
+
+    @staticmethod
+    def record(request, response, stats, duration):
+        match = request.resolver_match
+        registry.record(
+            match.view_name if match else 'unresolved',
+            request.method,
+            response.status_code,
+            stats,
+            duration,
+        )
@@ -1,34 +1,93 @@
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 
+from api.serializers import BulkSerializer
+
 
 class CreateDeleteMixin:
+    """Добавление и удаление связей пользователя по одному id и
+    списком. add(ids) возвращает (добавленные, уже добавленные),
+    remove(ids) – удалённые; оба делают одну вставку или удаление на
+    весь список, статус ответа следует из числа затронутых строк."""
 
-    def add_item(
-            self,
-            serializer_create_class,
-            serializer_read_class,
-            read_model,
-            data,
-            request,
-            id,
-    ):
-        serializer = serializer_create_class(
-            data=data,
-            context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+    def get_item_id(self, pk):
+        if not str(pk).isdigit():
+            raise NotFound
+        return int(pk)
 
-        item = read_model.objects.get(id=id)
-        serializer = serializer_read_class(item)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    def get_statuses(self, ids, add, exists_error, not_found_error,
+                     rejected=None):
+        """{id: (статус, ошибка)}; rejected – {id: ошибка} для
+        отклонённых до вставки."""
+        rejected = rejected or {}
+        created, existing = add([pk for pk in ids if pk not in rejected])
+        statuses = {}
+        for pk in ids:
+            if pk in created:
+                statuses[pk] = (status.HTTP_201_CREATED, None)
+            elif pk in rejected or pk in existing:
+                statuses[pk] = (
+                    status.HTTP_400_BAD_REQUEST,
+                    rejected.get(pk, exists_error),
+                )
+            else:
+                statuses[pk] = (status.HTTP_404_NOT_FOUND, not_found_error)
+        return statuses
 
-    def delete_item(self, model, **kwargs):
-        instance = model.objects.filter(**kwargs)
+    def add_item(self, request, pk, add, read_queryset, serializer_class,
+                 exists_error, not_found_error, rejected=None):
+        pk = self.get_item_id(pk)
+        code, error = self.get_statuses(
+            [pk], add, exists_error, not_found_error, rejected
+        )[pk]
+        if error:
+            return Response({'errors': error}, status=code)
+        serializer = serializer_class(
+            read_queryset.get(pk=pk),
+            context={'request': request}
+        )
+        return Response(serializer.data, status=code)
 
-        if instance.exists():
-            instance.delete()
+    def delete_item(self, pk, remove, missing_error):
+        if remove([self.get_item_id(pk)]):
             return Response(status=status.HTTP_204_NO_CONTENT)
-        data = {'errors': 'Вы не подписаны на автора.'}
+        data = {'errors': missing_error}
         return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+    def get_bulk_ids(self, request):
+        serializer = BulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['ids']
+
+    def add_items(self, request, add, exists_error, not_found_error,
+                  rejected=None):
+        """Массовое добавление: по каждому id – статус, который вернул
+        бы запрос с одним id."""
+        ids = self.get_bulk_ids(request)
+        statuses = self.get_statuses(
+            ids, add, exists_error, not_found_error, rejected
+        )
+        results = []
+        for pk in ids:
+            code, error = statuses[pk]
+            result = {'id': pk, 'status': code}
+            if error:
+                result['errors'] = error
+            results.append(result)
+        return Response({'results': results})
+
+    def delete_items(self, request, remove, missing_error):
+        """Массовое удаление, remove(ids) возвращает id удалённых."""
+        ids = self.get_bulk_ids(request)
+        removed = remove(ids)
+        return Response({'results': [
+            {'id': pk, 'status': status.HTTP_204_NO_CONTENT}
+            if pk in removed else
+            {
+                'id': pk,
+                'status': status.HTTP_400_BAD_REQUEST,
+                'errors': missing_error,
+            }
+            for pk in ids
+        ]})
@@ -1,7 +1,212 @@
-from foodgram_backand.settings import PAGE_SIZE_PAGINATION
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as DecodeError
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+from foodgram_backand.settings import (
+    MAX_PAGE_SIZE_PAGINATION,
+    PAGE_SIZE_PAGINATION,
+)
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.filters import RECIPE_ORDERINGS
+from recipes.models import FeedItem
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = PAGE_SIZE_PAGINATION
     page_size_query_param = 'limit'
+
+
+def approximate_count(queryset):
+    """Оценка числа строк планировщиком PostgreSQL вместо COUNT(*)."""
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Даты в курсоре без потери точности: DjangoJSONEncoder обрезает
+    микросекунды, и строки с тем же моментом после курсора терялись."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """Постраничный вывод по ключу сортировки: страница N стоит столько же,
+    сколько первая. Общее число строк – оценочное."""
+
+    cursor_query_param = 'cursor'
+    page_size = PAGE_SIZE_PAGINATION
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE_PAGINATION
+    ordering = ('-pub_date', '-id')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(b64decode(cursor.encode()).decode())
+            if len(values) != len(self.ordering):
+                raise ValueError(cursor)
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (DecodeError, TypeError, ValueError, ValidationError):
+            raise NotFound('Неверный курсор.')
+
+    def encode_cursor(self, item):
+        values = [getattr(item, field.lstrip('-')) for field in self.ordering]
+        return b64encode(
+            json.dumps(values, cls=CursorEncoder).encode()
+        ).decode()
+
+    def after(self, position):
+        """Условие «строго после position» для составного ключа.
+
+        Нестрогая граница по первому полю даёт планировщику диапазон
+        по индексу, остальное условие лишь отсекает равные ключи.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        first = self.ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': position[0]}) & condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        self.count = approximate_count(queryset)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        page = list(queryset[:size + 1])
+        self.next_item = page[size - 1] if len(page) > size else None
+        return page[:size]
+
+    def get_next_link(self):
+        if self.next_item is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_item),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+
+class CursorOptInPagination(LimitPageNumberPagination):
+    """Номера страниц по умолчанию, ключевой курсор – при наличии
+    параметра cursor (для первой страницы – пустого)."""
+
+    cursor_class = KeysetPagination
+
+    def get_cursor(self, request):
+        return self.cursor_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = None
+        if self.cursor_class.cursor_query_param in request.query_params:
+            self.cursor = self.get_cursor(request)
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor is not None:
+            return self.cursor.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(CursorOptInPagination):
+    """Курсор строится по тому же ключу, что и выбранный ?ordering=.
+
+    Результаты ?search= упорядочены по релевантности, ключа для курсора
+    у них нет – только номера страниц.
+    """
+
+    def get_cursor(self, request):
+        if request.query_params.get('search'):
+            raise ParseError('Параметр cursor нельзя сочетать с search.')
+        cursor = super().get_cursor(request)
+        ordering = RECIPE_ORDERINGS.get(request.query_params.get('ordering'))
+        if ordering:
+            cursor.ordering = ordering
+        return cursor
+
+
+class SubscriptionKeysetPagination(KeysetPagination):
+    ordering = ('username', 'id')
+
+
+class SubscriptionPagination(CursorOptInPagination):
+    cursor_class = SubscriptionKeysetPagination
+
+
+class FeedPagination(KeysetPagination):
+    """Лента подписок из нескольких частей: каждая читается диапазоном
+    по своему индексу, страницы сливаются в памяти."""
+
+    ordering = ('-pub_date', '-recipe_id')
+
+    def encode_cursor(self, item):
+        return b64encode(json.dumps(
+            [item[field.lstrip('-')] for field in self.ordering],
+            cls=CursorEncoder,
+        ).encode()).decode()
+
+    def paginate_queryset(self, parts, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        position = self.decode_cursor(request, FeedItem)
+        page = []
+        self.count = 0
+        for queryset in parts:
+            queryset = queryset.order_by(*self.ordering)
+            self.count += approximate_count(queryset)
+            if position is not None:
+                queryset = queryset.filter(self.after(position))
+            page += queryset[:size + 1]
+        page.sort(
+            key=lambda item: (item['pub_date'], item['recipe_id']),
+            reverse=True,
+        )
+        self.next_item = page[size - 1] if len(page) > size else None
+        return page[:size]
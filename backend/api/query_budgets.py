@@ -0,0 +1,370 @@
+"""Бюджеты запросов к БД для всех маршрутов api.urls.
+
+Число запросов не должно расти с размером страницы или объёмом данных
+(1/10/100). Бюджеты проверяет QueryBudgetTests в api.tests, планы тех
+же запросов на PostgreSQL – команда check_queries.
+"""
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, reverse
+
+import api.urls
+from recipes import reference
+from recipes.counters import recount
+from recipes.models import (
+    Favorite,
+    FeedItem,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeSimilarity,
+    ShoppingCart,
+    Tag,
+)
+from recipes.shopping_cart import rebuild
+from recipes.versions import bump_versions
+from users.models import Follow
+
+User = get_user_model()
+
+PAGE_SIZES = (1, 10, 100)
+AUTHORS = 100
+RECIPES_PER_AUTHOR = 2
+PASSWORD = 'check-password'
+METRICS_TOKEN = 'check-metrics'
+EMAIL_DOMAIN = 'check.local'
+
+
+class Case:
+    """Запрос к маршруту и его бюджет запросов к БД.
+
+    Параметры, тело, аргументы адреса и подготовка данных – функции от
+    (данные, размер), headers – заголовки запроса. Размер – 1/10/100:
+    размер страницы или объём данных, от которого число запросов
+    зависеть не должно.
+    """
+
+    def __init__(self, route, method, budget, label='', anonymous=False,
+                 kwargs=None, params=None, data=None, setup=None,
+                 sized=True, headers=None):
+        self.route = route
+        self.method = method
+        self.budget = budget
+        self.label = label
+        self.anonymous = anonymous
+        self.kwargs = kwargs
+        self.params = params
+        self.data = data
+        self.setup = setup
+        self.headers = headers or {}
+        self.sizes = PAGE_SIZES if sized else PAGE_SIZES[-1:]
+
+    @property
+    def key(self):
+        return ' '.join(filter(None, (self.route, self.method, self.label)))
+
+
+def fill_cart(fixture, size):
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=fixture.user, recipe_id=recipe)
+        for recipe in fixture.recipes[:size]
+    )
+    rebuild([fixture.user.id])
+
+
+def fill_favorites(fixture, size):
+    Favorite.objects.bulk_create(
+        Favorite(user=fixture.user, recipe_id=recipe)
+        for recipe in fixture.recipes[:size]
+    )
+
+
+def fill_similar(fixture, size):
+    RecipeSimilarity.objects.bulk_create(
+        RecipeSimilarity(recipe_id=fixture.recipes[0], similar_id=recipe,
+                         score=1 / (number + 1))
+        for number, recipe in enumerate(fixture.recipes[1:size + 1])
+    )
+
+
+def unfollow_all(fixture, size):
+    Follow.objects.filter(follower=fixture.user).delete()
+
+
+def recipe_data(fixture, size):
+    return {
+        'name': f'Проверка {size}',
+        'text': 'Текст',
+        'cooking_time': 10,
+        'image': fixture.image,
+        'tags': fixture.tags,
+        'ingredients': [
+            # Не пересекаются с составом рецептов данных: при любом
+            # размере старые строки удаляются, новые создаются.
+            {'id': pk, 'amount': 2} for pk in fixture.ingredients[-size:]
+        ],
+    }
+
+
+# Бюджеты – числа запросов, замеренные на SQLite. На PostgreSQL их
+# подтверждает прогон тестов с этой базой.
+CASES = (
+    Case('api-root', 'GET', 0, anonymous=True, sized=False),
+    Case('metrics', 'GET', 0, anonymous=True, sized=False,
+         headers={'HTTP_AUTHORIZATION': f'Bearer {METRICS_TOKEN}'}),
+    Case('login', 'POST', 6, anonymous=True, sized=False,
+         data=lambda f, size: {'email': f.user.email, 'password': PASSWORD}),
+    Case('logout', 'POST', 1, sized=False),
+    Case('users-list', 'GET', 2, anonymous=True,
+         params=lambda f, size: {'limit': size}),
+    Case('users-list', 'POST', 5, anonymous=True, sized=False,
+         data=lambda f, size: {
+             'email': f'new@{EMAIL_DOMAIN}', 'username': 'check-new',
+             'first_name': 'Новый', 'last_name': 'Пользователь',
+             'password': 'Check-Pass-2024',
+         }),
+    Case('users-me', 'GET', 1, sized=False),
+    Case('users-me', 'PATCH', 3, sized=False,
+         data=lambda f, size: {'first_name': 'Изменено'}),
+    Case('users-detail', 'GET', 2,
+         kwargs=lambda f, size: {'id': f.authors[0]}, sized=False),
+    Case('users-set-password', 'POST', 2, sized=False,
+         data=lambda f, size: {
+             'current_password': PASSWORD, 'new_password': 'Check-Pass-2024',
+         }),
+    Case('users-subscriptions', 'GET', 3,
+         params=lambda f, size: {'limit': size, 'recipes_limit': size}),
+    Case('users-subscribe', 'POST', 7, sized=False,
+         kwargs=lambda f, size: {'id': f.stranger}),
+    Case('users-subscribe', 'DELETE', 5, sized=False,
+         kwargs=lambda f, size: {'id': f.authors[0]}),
+    Case('users-subscribe-many', 'POST', 5, setup=unfollow_all,
+         data=lambda f, size: {'ids': f.authors[:size]}),
+    Case('users-subscribe-many', 'DELETE', 5,
+         data=lambda f, size: {'ids': f.authors[:size]}),
+    Case('tags-list', 'GET', 0, anonymous=True, sized=False),
+    Case('tags-detail', 'GET', 0, anonymous=True, sized=False,
+         kwargs=lambda f, size: {'pk': f.tags[0]}),
+    Case('ingredients-list', 'GET', 0, anonymous=True, sized=False),
+    Case('ingredients-list', 'GET', 1, label='name', anonymous=True,
+         sized=False, params=lambda f, size: {'name': 'Про'}),
+    Case('ingredients-detail', 'GET', 0, anonymous=True, sized=False,
+         kwargs=lambda f, size: {'pk': f.ingredients[0]}),
+    Case('recipes-list', 'GET', 4, label='anonymous', anonymous=True,
+         params=lambda f, size: {'limit': size}),
+    Case('recipes-list', 'GET', 5, label='filters', setup=fill_favorites,
+         params=lambda f, size: {
+             'limit': size, 'tags': [f.tag_slug], 'is_favorited': 1,
+         }),
+    Case('recipes-list', 'GET', 5, label='cursor',
+         params=lambda f, size: {'limit': size, 'cursor': ''}),
+    Case('recipes-list', 'GET', 5, label='trending',
+         params=lambda f, size: {'limit': size, 'ordering': 'trending'}),
+    Case('recipes-list', 'POST', 18, data=recipe_data),
+    Case('recipes-detail', 'GET', 3, label='anonymous', anonymous=True,
+         sized=False, kwargs=lambda f, size: {'pk': f.recipes[0]}),
+    Case('recipes-detail', 'GET', 4, label='authenticated', sized=False,
+         kwargs=lambda f, size: {'pk': f.recipes[0]}),
+    Case('recipes-detail', 'PATCH', 17,
+         kwargs=lambda f, size: {'pk': f.own_recipe},
+         data=recipe_data),
+    Case('recipes-detail', 'PUT', 17,
+         kwargs=lambda f, size: {'pk': f.own_recipe},
+         data=recipe_data),
+    Case('recipes-detail', 'DELETE', 13, sized=False,
+         kwargs=lambda f, size: {'pk': f.own_recipe}),
+    Case('recipes-feed', 'GET', 7, params=lambda f, size: {'limit': size}),
+    Case('recipes-similar', 'GET', 1, anonymous=True, setup=fill_similar,
+         kwargs=lambda f, size: {'pk': f.recipes[0]}),
+    Case('recipes-pantry-match', 'POST', 1, anonymous=True,
+         data=lambda f, size: {
+             'ingredients': f.ingredients[:5], 'limit': size,
+         }),
+    Case('recipes-favorite', 'POST', 5, sized=False,
+         kwargs=lambda f, size: {'pk': f.recipes[0]}),
+    Case('recipes-favorite', 'DELETE', 4, sized=False,
+         setup=fill_favorites,
+         kwargs=lambda f, size: {'pk': f.recipes[0]}),
+    Case('recipes-add-to-cart', 'POST', 7, sized=False,
+         kwargs=lambda f, size: {'pk': f.recipes[0]}),
+    Case('recipes-add-to-cart', 'DELETE', 7, sized=False, setup=fill_cart,
+         kwargs=lambda f, size: {'pk': f.recipes[0]}),
+    Case('recipes-favorite-many', 'POST', 4,
+         data=lambda f, size: {'ids': f.recipes[:size]}),
+    Case('recipes-favorite-many', 'DELETE', 4, setup=fill_favorites,
+         data=lambda f, size: {'ids': f.recipes[:size]}),
+    Case('recipes-shopping-cart', 'GET', 1, setup=fill_cart),
+    Case('recipes-shopping-cart', 'POST', 6,
+         data=lambda f, size: {'ids': f.recipes[:size]}),
+    Case('recipes-shopping-cart', 'DELETE', 7, setup=fill_cart,
+         data=lambda f, size: {'ids': f.recipes[:size]}),
+    Case('recipes-download-shopping-cart', 'GET', 2, setup=fill_cart),
+)
+
+# Маршруты djoser, которыми фронтенд не пользуется.
+SKIPPED = {
+    ('users-activation', 'POST'): 'отправка писем',
+    ('users-resend-activation', 'POST'): 'отправка писем',
+    ('users-reset-password', 'POST'): 'отправка писем',
+    ('users-reset-password-confirm', 'POST'): 'отправка писем',
+    ('users-reset-username', 'POST'): 'отправка писем',
+    ('users-reset-username-confirm', 'POST'): 'отправка писем',
+    ('users-set-username', 'POST'): 'не используется',
+    ('users-me', 'PUT'): 'не используется',
+    ('users-me', 'DELETE'): 'не используется',
+    ('users-detail', 'PUT'): 'не используется',
+    ('users-detail', 'PATCH'): 'не используется',
+    ('users-detail', 'DELETE'): 'не используется',
+}
+
+
+def routes(patterns=None):
+    """(имя маршрута, HTTP-метод) всех адресов api.urls."""
+    found = set()
+    for pattern in patterns or api.urls.urlpatterns:
+        if isinstance(pattern, URLResolver):
+            found |= routes(pattern.url_patterns)
+            continue
+        callback = pattern.callback
+        actions = getattr(callback, 'actions', None)
+        view_class = getattr(callback, 'view_class', None)
+        if actions:
+            methods = actions
+        elif view_class:
+            methods = [
+                method for method in view_class.http_method_names
+                if hasattr(view_class, method)
+            ]
+        else:
+            methods = ['get']
+        found |= {
+            (pattern.name, method.upper()) for method in methods
+            if method not in ('head', 'options')
+        }
+    return found
+
+
+class Fixture:
+    """Данные проверки: авторы с рецептами, подписки пользователя на
+    них, справочники. Создаются в транзакции, которая откатывается."""
+
+    image = (
+        'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+        'FcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+    )
+
+    def __init__(self):
+        self.tags = list(Tag.objects.values_list('id', flat=True)[:3])
+        if len(self.tags) < 3:
+            Tag.objects.bulk_create(
+                Tag(name=f'Проверка {number}', slug=f'check-{number}',
+                    color=f'#00000{number}')
+                for number in range(3 - len(self.tags))
+            )
+            self.tags = list(Tag.objects.values_list('id', flat=True)[:3])
+        self.tag_slug = Tag.objects.get(id=self.tags[0]).slug
+        count = 2 * max(PAGE_SIZES)
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Проверка {number}', measurement_unit='г')
+            for number in range(count)
+        )
+        self.ingredients = list(Ingredient.objects.filter(
+            name__startswith='Проверка'
+        ).values_list('id', flat=True)[:count])
+        reference.tags.invalidate()
+        reference.ingredients.invalidate()
+
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            User(email=f'check-{number}@{EMAIL_DOMAIN}',
+                 username=f'check-{number}', first_name='Проверка',
+                 last_name=str(number), password=password)
+            for number in range(AUTHORS + 2)
+        )
+        users = list(User.objects.filter(
+            email__endswith=f'@{EMAIL_DOMAIN}'
+        ).order_by('id'))
+        self.user, stranger, *authors = users
+        self.stranger = stranger.id
+        self.authors = [author.id for author in authors]
+        Recipe.objects.bulk_create(
+            Recipe(name=f'Проверка {author.id}-{number}', text='Текст',
+                   author=author, image='recipe_images/check.png',
+                   cooking_time=10)
+            for author in [self.user, stranger, *authors]
+            for number in range(RECIPES_PER_AUTHOR)
+        )
+        recipes = list(Recipe.objects.filter(
+            author__in=users
+        ).order_by('-pub_date', '-id').values_list('id', 'author_id'))
+        self.own_recipe = next(
+            pk for pk, author in recipes if author == self.user.id
+        )
+        self.recipes = [
+            pk for pk, author in recipes if author in self.authors
+        ]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe_id=pk, ingredient_id=ingredient,
+                             amount=1)
+            for number, (pk, _) in enumerate(recipes)
+            for ingredient in self.ingredients[number % 50:][:5]
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=pk, tag_id=tag)
+            for pk, _ in recipes for tag in self.tags
+        )
+        Follow.objects.bulk_create(
+            Follow(follower=self.user, following_id=author)
+            for author in self.authors
+        )
+        FeedItem.objects.bulk_create(
+            FeedItem(user=self.user, recipe_id=pk, author_id=author,
+                     pub_date=pub_date)
+            for pk, author, pub_date in Recipe.objects.filter(
+                author__in=self.authors
+            ).values_list('id', 'author_id', 'pub_date')
+        )
+        recount()
+
+
+def request(client, case, fixture, size):
+    path = reverse(
+        case.route, kwargs=case.kwargs(fixture, size)
+        if case.kwargs else None
+    )
+    params = case.params(fixture, size) if case.params else {}
+    if params:
+        path = f'{path}?{urlencode(params, doseq=True)}'
+    data = case.data(fixture, size) if case.data else None
+    return getattr(client, case.method.lower())(
+        path, data, format='json', **case.headers
+    )
+
+
+def measure(client, case, fixture, size, inspect=None):
+    """Запросы к БД и статус ответа; изменения данных откатываются.
+
+    Тело потокового ответа читается внутри замера: его запросы идут,
+    пока ответ отдаётся. inspect(запросы) вызывается до отката.
+    """
+    with transaction.atomic():
+        if case.setup:
+            case.setup(fixture, size)
+        # Новая версия данных – ответ анонимным не из кеша.
+        bump_versions(['recipes', *(
+            f'recipe:{pk}' for pk in fixture.recipes
+        )])
+        with CaptureQueriesContext(connection) as context:
+            response = request(client, case, fixture, size)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        if inspect:
+            inspect(context.captured_queries)
+        transaction.set_rollback(True)
+    # Запрос мог изменить пользователя в памяти, например пароль.
+    fixture.user.refresh_from_db()
+    return context.captured_queries, response.status_code
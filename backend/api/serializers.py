@@ -1,23 +1,28 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import exceptions, fields, serializers
 
+from api.metrics import TimedSerializerMixin
+from api.services import get_followed_ids
 from recipes.models import (
-    Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
-    ShoppingCart,
+    ShoppingCartIngredient,
     Tag,
 )
-from users.models import Follow
+from recipes import reference
+from recipes.images import srcset
+from recipes.shopping_cart import change_recipe
+from recipes.tasks import refresh_similar_recipes
 
 User = get_user_model()
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = fields.SerializerMethodField()
 
     class Meta:
@@ -32,11 +37,10 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
-        return (
-            request and request.user.is_authenticated
-            and obj.follower.filter(follower=request.user).exists()
-        )
+        return bool(request) and obj.id in get_followed_ids(request)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -53,41 +57,88 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         )
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
         fields = '__all__'
 
 
-class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.ReadOnlyField(source='ingredient.id')
+class ReferenceField(serializers.ReadOnlyField):
+    """Поле строки справочника в памяти, source – id строки.
+
+    Справочник передаётся именем: аргументы полей копируются при
+    создании сериализатора, а таблица с блокировкой не копируется.
+    """
+
+    def __init__(self, table, attribute, **kwargs):
+        self.table = table
+        self.attribute = attribute
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        row = getattr(reference, self.table).get(value)
+        return getattr(row, self.attribute)
+
+
+class RecipeIngredientSerializer(TimedSerializerMixin,
+                                 serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient_id')
+    name = ReferenceField('ingredients', 'name', source='ingredient_id')
+    measurement_unit = ReferenceField(
+        'ingredients', 'measurement_unit', source='ingredient_id'
+    )
+
+    class Meta:
+        model = RecipeIngredient
+        fields = (
+            'id',
+            'name',
+            'measurement_unit',
+            'amount',
+        )
+
+
+class ShoppingCartIngredientSerializer(TimedSerializerMixin,
+                                       serializers.ModelSerializer):
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
         source='ingredient.measurement_unit'
     )
+    amount = serializers.ReadOnlyField(source='total')
 
     class Meta:
-        model = RecipeIngredient
+        model = ShoppingCartIngredient
         fields = (
-            'id',
             'name',
             'measurement_unit',
             'amount',
         )
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    tags = TagSerializer(many=True)
+class RecipeImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    images = serializers.SerializerMethodField()
+
+    def get_images(self, obj):
+        request = self.context.get('request')
+        return srcset(
+            obj.image,
+            obj.image_variants,
+            request.build_absolute_uri if request else str,
+        )
+
+
+class RecipeSerializer(RecipeImageSerializer):
+    tags = serializers.SerializerMethodField()
     author = CustomUserSerializer(read_only=True)
-    ingredients = RecipeIngredientSerializer(many=True, source='recipes')
+    ingredients = serializers.SerializerMethodField()
     image = Base64ImageField()
     is_favorited = serializers.BooleanField(read_only=True)
     is_in_shopping_cart = serializers.BooleanField(read_only=True)
@@ -103,16 +154,35 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
+            'favorites_count',
+            'shopping_cart_count',
+            'updated_at',
         )
 
+    def get_related(self, obj, name):
+        # Тэги и состав только что сохранённого рецепта передаёт
+        # RecipeCreateSerializer, иначе они из prefetch_related.
+        related = self.context.get('related', {})
+        return related[name] if name in related else getattr(obj, name).all()
+
+    def get_tags(self, obj):
+        rows = reference.tags.in_bulk(
+            [tag.id for tag in self.get_related(obj, 'tags')]
+        )
+        return TagSerializer(rows.values(), many=True).data
+
+    def get_ingredients(self, obj):
+        return RecipeIngredientSerializer(
+            self.get_related(obj, 'recipes'), many=True
+        ).data
+
 
 class RecipeIngredientCreateSerialazer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all()
-    )
+    # Ингредиенты ищутся одним запросом в RecipeCreateSerializer.
+    id = serializers.IntegerField(min_value=1)
     name = serializers.ReadOnlyField(
         source='ingredient.name'
     )
@@ -130,8 +200,37 @@ class RecipeIngredientCreateSerialazer(serializers.ModelSerializer):
         )
 
 
+def get_rows(table, ids, message):
+    """Строки справочника по списку id; ошибка перечисляет
+    все отсутствующие id сразу."""
+    rows = table.in_bulk(ids)
+    missing = sorted(set(ids) - rows.keys())
+    if missing:
+        raise exceptions.ValidationError(
+            f'{message}: {", ".join(map(str, missing))}.'
+        )
+    return [rows[pk] for pk in ids]
+
+
+def create_ingredients(recipe, ingredients):
+    rows = [
+        RecipeIngredient(
+            recipe=recipe,
+            ingredient_id=ingredient_data['ingredient'].id,
+            amount=ingredient_data['amount'],
+        )
+        for ingredient_data in ingredients
+    ]
+    RecipeIngredient.objects.bulk_create(rows)
+    return rows
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientCreateSerialazer(many=True)
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1))
+    # base64 разбирается в запросе: битое изображение должно дать ответ
+    # 400, а не проваленную задачу. Дорогая часть – копии разных размеров –
+    # собирается в очереди (recipes.tasks.build_image_variants).
     image = Base64ImageField(max_length=None, use_url=True)
 
     class Meta:
@@ -145,21 +244,27 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'image',
         )
 
-    def validate_ingredients(self, obj):
-        ingredients = self.initial_data.get('ingredients')
+    def validate_ingredients(self, ingredients):
         inrgedient_list = [ingredient['id'] for ingredient in ingredients]
         if not ingredients:
             raise exceptions.ValidationError('Добавьте ингредиент.')
         if len(inrgedient_list) != len(set(inrgedient_list)):
             raise exceptions.ValidationError('Ингредиенты не уникальны.')
-        return obj
+        objects = get_rows(
+            reference.ingredients, inrgedient_list, 'Нет ингредиентов с id'
+        )
+        return [
+            {'ingredient': ingredient, 'amount': ingredient_data['amount']}
+            for ingredient, ingredient_data in zip(objects, ingredients)
+        ]
 
-    def validate_tags(self, obj):
-        tags = self.initial_data.get('tags')
+    def validate_tags(self, tags):
         if not tags:
             raise exceptions.ValidationError(
                 'Добавьте  тэг для рецепта!')
-        return obj
+        return get_rows(
+            reference.tags, list(dict.fromkeys(tags)), 'Нет тэгов с id'
+        )
 
     def validate_cooking_time(self, cooking_time):
         if int(cooking_time) < 1:
@@ -168,51 +273,88 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return cooking_time
 
     @staticmethod
-    def __create_ingredients(recipe, ingredients):
-        RecipeIngredient.objects.bulk_create(
-            [RecipeIngredient(recipe=recipe,
-             ingredient=ingredient_data['ingredient'],
-             amount=ingredient_data['amount'])
-             for ingredient_data in ingredients])
+    def __save_ingredients(recipe, ingredients):
+        """Приводит состав рецепта к ingredients: добавляет новые строки,
+        меняет изменившиеся количества и удаляет лишние – по одному
+        запросу на каждое действие. Возвращает итоговые строки и прежние
+        и новые количества изменившихся ингредиентов."""
+        current = {row.ingredient_id: row for row in recipe.recipes.all()}
+        rows, changed, created = [], [], []
+        old_amounts, new_amounts = {}, {}
+        for ingredient_data in ingredients:
+            ingredient = ingredient_data['ingredient']
+            amount = ingredient_data['amount']
+            row = current.pop(ingredient.id, None)
+            if row is None:
+                created.append(ingredient_data)
+                new_amounts[ingredient.id] = amount
+                continue
+            if row.amount != amount:
+                old_amounts[ingredient.id] = row.amount
+                new_amounts[ingredient.id] = row.amount = amount
+                changed.append(row)
+            rows.append(row)
+        if created:
+            rows += create_ingredients(recipe, created)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        if current:
+            RecipeIngredient.objects.filter(
+                id__in=[row.id for row in current.values()]
+            ).delete()
+            old_amounts.update(
+                (ingredient, row.amount) for ingredient, row in current.items()
+            )
+        return rows, old_amounts, new_amounts
 
     @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
         validated_data['author'] = self.context['request'].user
-        instance = super().create(validated_data)
-        self.__create_ingredients(instance, ingredients)
+        instance = Recipe.objects.create(**validated_data)
+        instance.tags.set([tag.id for tag in tags])
+        rows = create_ingredients(instance, ingredients)
+        instance.is_favorited = False
+        instance.is_in_shopping_cart = False
+        self.related = {'tags': tags, 'recipes': rows}
         return instance
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.__create_ingredients(instance, ingredients)
-        return super().update(instance, validated_data)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            instance.tags.set([tag.id for tag in tags])
+        else:
+            tags = instance.tags.all()
+        if ingredients is not None:
+            rows, old_amounts, new_amounts = self.__save_ingredients(
+                instance, ingredients
+            )
+            if old_amounts or new_amounts:
+                change_recipe(instance.id, old_amounts, new_amounts)
+            if old_amounts.keys() ^ new_amounts.keys():
+                refresh_similar_recipes.enqueue(instance.id)
+        else:
+            rows = instance.recipes.all()
+        self.related = {'tags': list(tags), 'recipes': list(rows)}
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Рецепт сохраняется всегда: это обновляет updated_at и версию
+        # кеша, массовые операции над составом сигналов не посылают.
+        instance.save(update_fields=(*validated_data, 'updated_at'))
+        return instance
 
     def to_representation(self, instance):
-        from django.db.models.expressions import Exists, OuterRef
-        request = self.context.get('request')
-        annotated_instance = Recipe.objects.annotate(
-            is_favorited=Exists(
-                Favorite.objects.filter(
-                    user=request.user, recipe=OuterRef('id'))),
-            is_in_shopping_cart=Exists(
-                ShoppingCart.objects.filter(
-                    user=request.user, recipe=OuterRef('id')))
-        ).select_related('author').prefetch_related(
-            'recipes__ingredient', 'tags'
-        ).get(id=instance.id)
-
-        return RecipeSerializer(
-            annotated_instance,
-            context={'request': self.context.get('request')}
-        ).data
+        # UpdateModelMixin сбрасывает кеш prefetch_related после save(),
+        # поэтому сохранённые тэги и состав передаются явно.
+        return RecipeSerializer(instance, context={
+            **self.context, 'related': getattr(self, 'related', {}),
+        }).data
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(RecipeImageSerializer):
 
     class Meta:
         model = Recipe
@@ -220,85 +362,70 @@ class RecipeShortSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'images',
             'cooking_time',
         )
 
 
-class FollowSerializer(CustomUserSerializer):
-    recipes = RecipeShortSerializer(read_only=True, many=True)
-    # recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
-
-    class Meta(CustomUserSerializer.Meta):
-        fields = CustomUserSerializer.Meta.fields + (
-            'recipes',
-            'recipes_count',
-        )
-
-    def get_recipes(self, obj):
-
-        limit = self.context.get('request').query_params.get('recipe_limit')
-        queryset = obj.recipes.all()
-        if limit:
-            queryset = queryset[:int(limit)]
-
-        return RecipeShortSerializer(
-            queryset,
-            many=True,
-            context=self.context
-        ).data
+class SimilarRecipeSerializer(RecipeShortSerializer):
+    similarity = serializers.FloatField(read_only=True)
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+    class Meta(RecipeShortSerializer.Meta):
+        fields = RecipeShortSerializer.Meta.fields + ('similarity',)
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Follow
-        fields = (
-            'follower',
-            'following',
-        )
-
-    def validate(self, attrs):
-        follower = attrs.get('follower')
-        following = attrs.get('following')
-        if follower == following:
-            raise serializers.ValidationError(
-                'Вы не можете подписаться на самого себя.'
-            )
-        if Follow.objects.filter(
-            follower=follower, following=following
-        ).exists():
-            raise serializers.ValidationError(
-                'Вы уже подписаны на  пользователя.'
-            )
-        return attrs
+class PantryMatchSerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.PANTRY_MAX_INGREDIENTS,
+    )
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.PANTRY_MATCH_MAX_LIMIT,
+        default=settings.PANTRY_MATCH_LIMIT,
+    )
 
+    def validate_ingredients(self, ingredients):
+        ids = list(dict.fromkeys(ingredients))
+        get_rows(reference.ingredients, ids, 'Нет ингредиентов с id')
+        return ids
 
-class FavoriteShopSerializer(serializers.ModelSerializer):
 
-    class Meta:
-        fields = ('user', 'recipe')
+class BulkSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_IDS,
+    )
 
-    def validate(self, data):
-        user = data.get('user')
-        recipe = data.get('recipe')
-        if self.Meta.model.objects.filter(user=user, recipe=recipe).exists():
-            raise serializers.ValidationError(
-                f'Рецепт уже добавлен в '
-                f'{self.Meta.model._meta.verbose_name}.'
-            )
-        return data
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
 
 
-class FavoriteSerializer(FavoriteShopSerializer):
+class PantryRecipeSerializer(RecipeShortSerializer):
+    have = serializers.IntegerField(read_only=True)
+    total = serializers.IntegerField(read_only=True)
+    missing = IngredientSerializer(many=True, read_only=True)
 
-    class Meta(FavoriteShopSerializer.Meta):
-        model = Favorite
+    class Meta(RecipeShortSerializer.Meta):
+        fields = RecipeShortSerializer.Meta.fields + (
+            'have',
+            'total',
+            'missing',
+        )
 
 
-class ShoppingCartSerializer(FavoriteShopSerializer):
+class FollowSerializer(CustomUserSerializer):
+    recipes = RecipeShortSerializer(
+        source='latest_recipes',
+        read_only=True,
+        many=True,
+    )
 
-    class Meta(FavoriteShopSerializer.Meta):
-        model = ShoppingCart
+    class Meta(CustomUserSerializer.Meta):
+        fields = CustomUserSerializer.Meta.fields + (
+            'recipes',
+            'recipes_count',
+            'followers_count',
+        )
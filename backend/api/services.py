@@ -1,17 +1,95 @@
-from django.http import HttpResponse
-
-
-def create_shopping_cart(user, items):
-    shopping_cart = [
-        f'Список покупок для:\n{user.first_name}\n\n'
-    ]
-    text = '\n'.join([
-        f'{item["name"]} ({item["units"]}) - {item["total"]}'
-        for item in items
-    ])
-    shopping_cart.extend(text)
-    shopping_cart.append('\n\nРассчитано в Foodgram')
-    filename = 'foodgram_shoping_cart.txt'
-    response = HttpResponse(shopping_cart, content_type='text/plain')
+import csv
+import hashlib
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils.http import quote_etag
+
+from recipes.models import ShoppingCartIngredient
+from recipes.versions import get_version
+from users.models import Follow
+
+
+def get_followed_ids(request):
+    """Id авторов, на которых подписан пользователь запроса.
+
+    Загружаются одним запросом и кешируются на объекте запроса,
+    так что все сериализаторы одного ответа используют общий результат.
+    """
+    if not hasattr(request, '_followed_ids'):
+        request._followed_ids = (
+            set(Follow.objects.filter(
+                follower=request.user
+            ).values_list('following_id', flat=True))
+            if request.user.is_authenticated else set()
+        )
+    return request._followed_ids
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_txt(user, items):
+    yield f'Список покупок для:\n{user.first_name}\n\n'
+    for item in items:
+        yield f'{item["name"]} ({item["units"]}) - {item["total"]}\n'
+    yield '\nРассчитано в Foodgram'
+
+
+def shopping_cart_csv(user, items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in items:
+        yield writer.writerow((item['name'], item['units'], item['total']))
+
+
+def shopping_cart_json(user, items):
+    separator = '['
+    for item in items:
+        yield separator + json.dumps({
+            'name': item['name'],
+            'measurement_unit': item['units'],
+            'amount': item['total'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': ('text/plain', shopping_cart_txt),
+    'csv': ('text/csv', shopping_cart_csv),
+    'json': ('application/json', shopping_cart_json),
+}
+
+
+def shopping_cart_etag(user, file_format):
+    """Валидатор списка покупок без построения самого списка.
+
+    Хеш пар (ингредиент, количество), версии справочника ингредиентов
+    (названия и единицы в файле) и имени пользователя: в заголовке
+    только ASCII, а перестановка количеств между строками меняет его.
+    """
+    state = hashlib.md5(
+        f'{user.id}:{file_format}:{user.first_name}:'
+        f'{get_version("ingredients")}'.encode()
+    )
+    for ingredient, total in ShoppingCartIngredient.objects.filter(
+        user=user
+    ).order_by('ingredient_id').values_list('ingredient_id', 'total'):
+        state.update(f':{ingredient}={total}'.encode())
+    return quote_etag(state.hexdigest())
+
+
+def create_shopping_cart(user, items, file_format='txt'):
+    content_type, writer = SHOPPING_CART_FORMATS[file_format]
+    filename = f'foodgram_shoping_cart.{file_format}'
+    response = StreamingHttpResponse(
+        writer(user, items.iterator(chunk_size=2000)),
+        content_type=f'{content_type}; charset=utf-8',
+    )
     response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
@@ -0,0 +1,111 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+)
+from recipes.signals import bulk_loaded, rows_changed
+from recipes.versions import bump_versions
+from users.models import Follow
+
+User = get_user_model()
+
+# Справочники входят во все ответы о рецептах целиком.
+VERSIONED_MODELS = {
+    Tag: ('tags',),
+    Ingredient: ('ingredients',),
+}
+# Отметки пользователя: владелец строки – в этом поле.
+USER_MODELS = {
+    Favorite: 'user_id',
+    ShoppingCart: 'user_id',
+    Follow: 'follower_id',
+}
+
+
+def data_changed(names):
+    transaction.on_commit(partial(bump_versions, list(names)))
+
+
+def recipes_changed(recipe_ids, composition=True):
+    """Сбрасывает страницы рецептов recipe_ids и списки рецептов."""
+    names = ['recipes', *(f'recipe:{pk}' for pk in recipe_ids)]
+    if composition:
+        names.append('compositions')
+    data_changed(names)
+
+
+def model_changed(sender, **kwargs):
+    data_changed(VERSIONED_MODELS[sender])
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(model_changed, sender=model)
+    post_delete.connect(model_changed, sender=model)
+    bulk_loaded.connect(model_changed, sender=model)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    recipes_changed([instance.id])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    recipes_changed([instance.recipe_id])
+
+
+@receiver(bulk_loaded, sender=Recipe)
+@receiver(bulk_loaded, sender=RecipeIngredient)
+def recipes_loaded(sender, **kwargs):
+    # Загружаются новые рецепты: страницы прежних не меняются.
+    recipes_changed(())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            recipes_changed([instance.pk])
+    elif action == 'pre_clear':
+        recipes_changed(instance.recipes.values_list('id', flat=True))
+    elif action.startswith('post_') and pk_set:
+        recipes_changed(pk_set)
+
+
+def user_data_changed(sender, instance, **kwargs):
+    data_changed([f'user:{getattr(instance, USER_MODELS[sender])}'])
+
+
+def user_rows_changed(sender, user_id, **kwargs):
+    data_changed([f'user:{user_id}'])
+
+
+for model in USER_MODELS:
+    post_save.connect(user_data_changed, sender=model)
+    post_delete.connect(user_data_changed, sender=model)
+    rows_changed.connect(user_rows_changed, sender=model)
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    # Автор входит только в ответы о своих рецептах.
+    if not instance.recipes_count:
+        return
+    recipes = list(instance.recipes.values_list('id', flat=True))
+    if recipes:
+        recipes_changed(recipes, composition=False)
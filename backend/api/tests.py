@@ -0,0 +1,532 @@
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.query_budgets import (
+    CASES,
+    METRICS_TOKEN,
+    SKIPPED,
+    Fixture,
+    measure,
+    routes,
+)
+from jobs.models import Job
+from jobs.queue import prune
+
+from recipes.models import (
+    Favorite,
+    FeedItem,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+)
+from recipes.images import variant_widths
+from recipes.pantry import PantryIndex
+from recipes.shopping_cart import find_drift
+from recipes.tasks import recount_counters
+
+User = get_user_model()
+
+
+class KeysetPaginationTests(TestCase):
+    """Курсор не должен пропускать строки с одинаковым ключом даты."""
+
+    # Микросекунды, которые DjangoJSONEncoder отбросил бы.
+    pub_date = datetime(2024, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@test.local',
+            username='author',
+            password='Test-Pass-2024',
+            first_name='Автор',
+            last_name='Тестов',
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {number}',
+                text='Текст',
+                author=cls.author,
+                image='recipe_images/test.png',
+                cooking_time=10,
+            )
+            for number in range(6)
+        )
+        Recipe.objects.update(pub_date=cls.pub_date)
+        cls.reader = User.objects.create_user(
+            email='reader@test.local',
+            username='reader',
+            password='Test-Pass-2024',
+            first_name='Читатель',
+            last_name='Тестов',
+        )
+        FeedItem.objects.bulk_create(
+            FeedItem(
+                user=cls.reader,
+                recipe=recipe,
+                author=cls.author,
+                pub_date=cls.pub_date,
+            )
+            for recipe in Recipe.objects.all()
+        )
+
+    def setUp(self):
+        # Кеш ответов не откатывается вместе с транзакцией теста.
+        cache.clear()
+
+    def pages(self, client, url):
+        ids = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_recipes_with_equal_pub_date(self):
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+        self.assertEqual(
+            self.pages(APIClient(), '/api/recipes/?limit=2&cursor='),
+            expected,
+        )
+
+    def test_feed_with_equal_pub_date(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+        self.assertEqual(
+            self.pages(client, '/api/recipes/feed/?limit=2'), expected
+        )
+
+
+class ReferenceDataTests(TestCase):
+    """Рецепты для сериализации остаются обычными моделями."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@test.local',
+            username='author',
+            password='Test-Pass-2024',
+            first_name='Автор',
+            last_name='Тестов',
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт',
+            text='Текст',
+            author=author,
+            image='recipe_images/test.png',
+            cooking_time=10,
+        )
+        cls.recipe.tags.add(
+            Tag.objects.create(name='Завтрак', slug='breakfast')
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe,
+            ingredient=Ingredient.objects.create(
+                name='Мука', measurement_unit='г'
+            ),
+            amount=100,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_related_rows_can_be_saved(self):
+        recipe = Recipe.objects.with_reference().get(id=self.recipe.id)
+        row = recipe.recipes.all()[0]
+        row.amount = 200
+        row.save()
+        recipe.tags.all()[0].save()
+        self.assertEqual(row.ingredient.name, 'Мука')
+
+    def test_recipe_names_tags_and_ingredients(self):
+        response = APIClient().get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.data['tags'][0]['slug'], 'breakfast')
+        self.assertEqual(response.data['ingredients'][0]['name'], 'Мука')
+
+
+class ShoppingCartAdminTests(TestCase):
+    """Правки состава в админке доходят до сумм списков покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@test.local',
+            username='admin',
+            password='Test-Pass-2024',
+            first_name='Админ',
+            last_name='Тестов',
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт',
+            text='Текст',
+            author=cls.admin,
+            image='recipe_images/test.png',
+            cooking_time=10,
+        )
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.recipe.tags.add(cls.tag)
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        cls.row = RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=5
+        )
+        ShoppingCart.objects.create(user=cls.admin, recipe=cls.recipe)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def total(self):
+        return ShoppingCartIngredient.objects.filter(
+            user=self.admin
+        ).values_list('total', flat=True).first()
+
+    def test_recipe_ingredient_admin(self):
+        url = f'/admin/recipes/recipeingredient/{self.row.id}/'
+        response = self.client.post(f'{url}change/', {
+            'recipe': self.recipe.id,
+            'ingredient': self.ingredient.id,
+            'amount': 50,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.total(), 50)
+        self.client.post(f'{url}delete/', {'post': 'yes'})
+        self.assertIsNone(self.total())
+        self.assertEqual(find_drift(), set())
+
+    def test_recipe_inline(self):
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.recipe.id}/change/', {
+                'name': self.recipe.name,
+                'author': self.admin.id,
+                'tags': [self.tag.id],
+                'text': self.recipe.text,
+                'cooking_time': 10,
+                'recipes-TOTAL_FORMS': 1,
+                'recipes-INITIAL_FORMS': 1,
+                'recipes-0-id': self.row.id,
+                'recipes-0-recipe': self.recipe.id,
+                'recipes-0-ingredient': self.ingredient.id,
+                'recipes-0-amount': 50,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.total(), 50)
+        self.assertEqual(find_drift(), set())
+
+
+class QueryCountTests(TestCase):
+    """Число запросов списков не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            User.objects.create_user(
+                email=f'user{number}@test.local',
+                username=f'user{number}',
+                password='Test-Pass-2024',
+                first_name='Имя',
+                last_name='Фамилия',
+            )
+            for number in range(12)
+        ]
+        cls.user = users[0]
+        tags = [
+            Tag.objects.create(name=f'Тэг {number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}',
+                text='Текст',
+                author=users[number % 6],
+                image='recipe_images/test.png',
+                cooking_time=10,
+            )
+            recipe.tags.set(tags[:number % 3 + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in ingredients[:number % 4 + 1]
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in users[1:6]:
+            cls.user.follower.create(following=author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant(self, url, queries):
+        # Первый запрос заполняет справочники в памяти.
+        self.client.get(f'{url}?limit=1')
+        counts = [self.count(f'{url}?limit={size}') for size in (2, 10)]
+        self.assertEqual(counts[0], counts[1])
+        with self.assertNumQueries(queries):
+            self.client.get(f'{url}?limit=10')
+
+    def test_recipe_list(self):
+        self.assert_constant('/api/recipes/', 5)
+
+    def test_user_list(self):
+        self.assert_constant('/api/users/', 3)
+
+
+class AnonymousCacheTests(TestCase):
+    """Кеш ответов анонимным сбрасывается только изменёнными данными."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@test.local',
+            username='author',
+            password='Test-Pass-2024',
+            first_name='Автор',
+            last_name='Тестов',
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {number}',
+                text='Текст',
+                author=cls.author,
+                image='recipe_images/test.png',
+                cooking_time=10,
+            )
+            for number in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url):
+        return self.client.get(url)['X-Cache']
+
+    def test_favorite_and_signup_keep_cache(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.assertEqual(self.get('/api/recipes/'), 'MISS')
+        self.assertEqual(self.get(url), 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.author, recipe=self.recipes[0])
+            User.objects.create_user(
+                email='new@test.local',
+                username='new',
+                password='Test-Pass-2024',
+                first_name='Новый',
+                last_name='Тестов',
+            )
+        self.assertEqual(self.get('/api/recipes/'), 'HIT')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['favorites_count'], 1)
+
+    def test_recipe_change_keeps_other_recipes(self):
+        first, second = (
+            f'/api/recipes/{recipe.id}/' for recipe in self.recipes
+        )
+        self.get(first)
+        self.get(second)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[0].name = 'Новое название'
+            self.recipes[0].save()
+        self.assertEqual(self.get(first), 'MISS')
+        self.assertEqual(self.get(second), 'HIT')
+
+    def test_conditional_get_by_etag_only(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[0].save()
+        self.assertEqual(self.client.get(
+            url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT',
+        ).status_code, 200)
+
+
+@override_settings(RECIPE_IMAGE_WIDTHS=(300, 600, 1200))
+class ImageVariantsTests(SimpleTestCase):
+    """Копии не шире оригинала: thumbnail не увеличивает."""
+
+    def test_variant_widths(self):
+        self.assertEqual(variant_widths(2000), [300, 600, 1200])
+        self.assertEqual(variant_widths(1200), [300, 600, 1200])
+        self.assertEqual(variant_widths(1000), [300, 600, 1000])
+        self.assertEqual(variant_widths(200), [200])
+
+
+class JobQueueTests(TestCase):
+    """Ключ задачи не мешает поставить её заново после завершения."""
+
+    def test_keyed_enqueue(self):
+        job = recount_counters.enqueue(key='recount')
+        self.assertEqual(recount_counters.enqueue(key='recount'), job)
+        Job.objects.filter(id=job.id).update(
+            status=Job.FAILED, attempts=5, last_error='ошибка'
+        )
+        again = recount_counters.enqueue(key='recount')
+        self.assertEqual(again.id, job.id)
+        self.assertEqual(
+            (again.status, again.attempts, again.last_error),
+            (Job.PENDING, 0, ''),
+        )
+
+    def test_prune(self):
+        now = datetime.now(timezone.utc)
+        old, fresh, pending = (
+            recount_counters.enqueue() for _ in range(3)
+        )
+        Job.objects.filter(id=old.id).update(
+            status=Job.DONE, finished_at=now - timedelta(days=30)
+        )
+        Job.objects.filter(id=fresh.id).update(
+            status=Job.FAILED, finished_at=now
+        )
+        self.assertEqual(prune(), 1)
+        self.assertCountEqual(
+            Job.objects.values_list('id', flat=True), (fresh.id, pending.id)
+        )
+
+
+class PantryIndexTests(TestCase):
+    """Индекс кладовой видит правки состава в обход рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@test.local',
+            username='author',
+            password='Test-Pass-2024',
+            first_name='Автор',
+            last_name='Тестов',
+        )
+        cls.flour, cls.milk, cls.eggs = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Молоко', 'Яйца')
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Блины',
+            text='Текст',
+            author=author,
+            image='recipe_images/test.png',
+            cooking_time=10,
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=cls.recipe, ingredient=ingredient,
+                             amount=1)
+            for ingredient in (cls.flour, cls.milk)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.index = PantryIndex()
+        self.assertEqual(
+            self.match(self.flour), [(self.recipe.id, 1, 2)]
+        )
+
+    def match(self, ingredient):
+        self.index.checked_at = 0
+        return self.index.match([ingredient.id])
+
+    def test_cascade_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.delete()
+        self.assertEqual(self.match(self.milk), [])
+        self.assertEqual(
+            self.match(self.flour), [(self.recipe.id, 1, 1)]
+        )
+
+    def test_row_saved_alone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            row = RecipeIngredient.objects.get(ingredient=self.milk)
+            row.ingredient = self.eggs
+            row.save()
+        self.assertEqual(self.match(self.milk), [])
+        self.assertEqual(self.match(self.eggs), [(self.recipe.id, 1, 2)])
+
+
+class MetricsTests(TestCase):
+    """Server-Timing делит время запроса на части."""
+
+    def test_server_timing(self):
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+        timing = dict(
+            part.split(';dur=')
+            for part in APIClient().get(
+                '/api/tags/'
+            )['Server-Timing'].split(', ')
+        )
+        self.assertEqual(
+            list(timing), ['db', 'serializer', 'render', 'app', 'total']
+        )
+        self.assertGreater(float(timing['serializer']), 0)
+
+
+@override_settings(METRICS_TOKEN=METRICS_TOKEN)
+class QueryBudgetTests(TestCase):
+    """Бюджеты запросов к БД всех маршрутов api.urls, см.
+    api.query_budgets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = Fixture()
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.fixture.user)
+
+    def test_every_route_has_budget(self):
+        declared = {(case.route, case.method) for case in CASES}
+        self.assertEqual(routes() - declared - SKIPPED.keys(), set())
+
+    def test_budgets(self):
+        for case in CASES:
+            with self.subTest(case.key):
+                client = self.anonymous if case.anonymous else self.client
+                # Первый запрос заполняет справочники и индексы в памяти.
+                measure(client, case, self.fixture, case.sizes[0])
+                counts = []
+                for size in case.sizes:
+                    queries, status = measure(
+                        client, case, self.fixture, size
+                    )
+                    self.assertLess(status, 400)
+                    counts.append(len(queries))
+                self.assertEqual(len(set(counts)), 1, counts)
+                self.assertLessEqual(counts[0], case.budget)
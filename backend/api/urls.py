@@ -6,6 +6,7 @@ from api.views import (
     RecipeVeiwSet,
     TagVeiwSet,
     UserSubscribeView,
+    metrics,
 )
 
 router = routers.DefaultRouter()
@@ -16,6 +17,7 @@ router.register('recipes', RecipeVeiwSet, basename='recipes')
 
 
 urlpatterns = [
+    path('_metrics', metrics, name='metrics'),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include(router.urls))
 ]
@@ -1,170 +1,439 @@
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum
+from django.db.models import F, Prefetch, prefetch_related_objects
 from django.db.models.expressions import Value
+from django.http import (
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+)
+from django.utils.crypto import constant_time_compare
+from django.utils.http import parse_etags
 from djoser.views import UserViewSet
+from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from api.cache import (
+    cached_response,
+    conditional,
+    get_stats,
+    recipe_versions,
+)
 from api.filters import IngredientFilter, RecipeFilter
+from api.metrics import registry, render_counter
 from api.mixins import CreateDeleteMixin
-from api.pagination import LimitPageNumberPagination
+from api.negotiation import IgnoreFormatNegotiation
+from api.pagination import (
+    FeedPagination,
+    RecipePagination,
+    SubscriptionPagination,
+)
 from api.permissions import IsAuthorOrReadOnly
 from api.serializers import (
-    FavoriteSerializer,
     FollowSerializer,
     IngredientSerializer,
+    PantryMatchSerializer,
+    PantryRecipeSerializer,
     RecipeCreateSerializer,
     RecipeSerializer,
     RecipeShortSerializer,
-    ShoppingCartSerializer,
-    SubscriptionSerializer,
+    ShoppingCartIngredientSerializer,
+    SimilarRecipeSerializer,
     TagSerializer,
 )
-from api.services import create_shopping_cart
+from api.services import (
+    SHOPPING_CART_FORMATS,
+    create_shopping_cart,
+    shopping_cart_etag,
+)
+from recipes import bulk, pantry, reference
+from recipes.feed import get_feed
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingCart,
+    ShoppingCartIngredient,
     Tag,
 )
-from users.models import Follow
 
 User = get_user_model()
 
 
+def metrics(request):
+    """Гистограммы запросов в текстовом формате Prometheus.
+
+    Без METRICS_TOKEN доступ закрыт. Гистограммы – только этого
+    процесса, см. api.metrics.Registry; попадания в кеш ответов
+    анонимным считаются в общем кеше, по всем процессам.
+    """
+    if not settings.METRICS_TOKEN or not constant_time_compare(
+        request.headers.get('Authorization', ''),
+        f'Bearer {settings.METRICS_TOKEN}',
+    ):
+        return HttpResponseForbidden()
+    stats = get_stats()
+    return HttpResponse(
+        registry.render()
+        + render_counter(
+            'recipe_cache_hits_total',
+            'Ответы анонимным из кеша.',
+            stats['hits'],
+        )
+        + render_counter(
+            'recipe_cache_misses_total',
+            'Ответы анонимным мимо кеша.',
+            stats['misses'],
+        ),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
 class UserSubscribeView(CreateDeleteMixin, UserViewSet):
-    pagination_class = LimitPageNumberPagination
+    pagination_class = SubscriptionPagination
+
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return settings.SUBSCRIPTION_RECIPES_LIMIT
+        return max(0, min(limit, settings.SUBSCRIPTION_RECIPES_MAX_LIMIT))
+
+    def get_latest_recipes(self, author_ids):
+        return Prefetch(
+            'recipes',
+            queryset=Recipe.objects.latest_per_author(
+                author_ids, self.get_recipes_limit()
+            ),
+            to_attr='latest_recipes',
+        )
 
     @action(detail=False)
     def subscriptions(self, request):
 
-        queryset = Follow.objects.filter(follower=request.user)
+        queryset = User.objects.filter(
+            following__follower=request.user
+        ).annotate(is_subscribed=Value(True))
         page = self.paginate_queryset(queryset)
+        prefetch_related_objects(
+            page, self.get_latest_recipes([author.id for author in page])
+        )
         serializer = FollowSerializer(
-            [subscription.following for subscription in page],
+            page,
             many=True,
             context={'request': request},
         )
         return self.get_paginated_response(serializer.data)
 
-    @action(detail=True, methods=['post'], url_path='subscribe')
-    def subscribe(self, request, id):
-
-        data = {
-            'follower': self.request.user.id,
-            'following': id
-        }
+    def follow(self, request, id=None):
+        add = partial(bulk.follow, request.user.id)
+        errors = (
+            'Вы уже подписаны на пользователя.',
+            'Пользователь не найден.',
+            {request.user.id: 'Вы не можете подписаться на самого себя.'},
+        )
+        if id is None:
+            return self.add_items(request, add, *errors)
         return self.add_item(
-            SubscriptionSerializer,
-            FollowSerializer,
-            User,
-            data,
             request,
             id,
+            add,
+            User.objects.annotate(
+                is_subscribed=Value(True)
+            ).prefetch_related(self.get_latest_recipes([id])),
+            FollowSerializer,
+            *errors,
         )
 
+    def unfollow(self, request, id=None):
+        remove = partial(bulk.unfollow, request.user.id)
+        error = 'Вы не подписаны на автора.'
+        if id is None:
+            return self.delete_items(request, remove, error)
+        return self.delete_item(id, remove, error)
+
+    @action(detail=True, methods=['post'], url_path='subscribe')
+    def subscribe(self, request, id):
+        return self.follow(request, id)
+
     @subscribe.mapping.delete
     def unsubscribe(self, request, id):
-        return self.delete_item(
-            Follow, follower=request.user, following__id=id
-        )
+        return self.unfollow(request, id)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='subscribe',
+        url_name='subscribe-many',
+        permission_classes=(IsAuthenticated,),
+    )
+    def subscribe_many(self, request):
+        """Подписка на авторов из списка {"ids": [...]}."""
+        return self.follow(request)
+
+    @subscribe_many.mapping.delete
+    def unsubscribe_many(self, request):
+        return self.unfollow(request)
 
 
-class TagVeiwSet(ReadOnlyModelViewSet):
+class ReferenceViewMixin:
+    """Чтение справочника из копии в памяти процесса."""
+
+    table = None
+
+    def get_object(self):
+        try:
+            row = self.table.get(int(self.kwargs['pk']))
+        except ValueError:
+            row = None
+        if row is None:
+            raise NotFound
+        return row
+
+
+class TagVeiwSet(ReferenceViewMixin, ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    table = reference.tags
 
+    @conditional('tags')
+    def list(self, request, *args, **kwargs):
+        return Response(self.get_serializer(self.table.all(), many=True).data)
 
-class IngredientVeiwSet(ReadOnlyModelViewSet):
+    @conditional('tags')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class IngredientVeiwSet(ReferenceViewMixin, ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filterset_class = IngredientFilter
+    table = reference.ingredients
+
+    @conditional('ingredients')
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('name'):
+            return super().list(request, *args, **kwargs)
+        return Response(self.get_serializer(self.table.all(), many=True).data)
+
+    @conditional('ingredients')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class RecipeVeiwSet(CreateDeleteMixin, ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthorOrReadOnly,)
-    pagination_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
     filterset_class = RecipeFilter
 
-    # def dispatch(self, request, *args, **kwargs):
-    #     ''' Выводит количество и запросы к БД.
-    #     Оставил на время ревью.
-    #     '''
-    #     res = super().dispatch(request, *args, **kwargs)
-    #     from django.db import connection
-    #     print('##################', len(connection.queries), '#############')
-    #     for q in connection.queries:
-    #         print('>>>', q['sql'], '<<<')
-    #     return res
-
     def get_queryset(self):
         if self.request.user.is_authenticated:
             return Recipe.objects.user_annotation(self.request.user)
         return Recipe.objects.annotate(
             is_in_shopping_cart=Value(False),
             is_favorited=Value(False),
-        ).select_related('author').prefetch_related(
-            'recipes__ingredient', 'tags'
-        )
+        ).select_related('author').with_reference()
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    @conditional(recipe_versions)
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(recipe_versions)
+    @cached_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(
+            get_feed(request.user), request, self
+        )
+        recipes = self.get_queryset().in_bulk(
+            [item['recipe_id'] for item in page]
+        )
+        serializer = RecipeSerializer(
+            [
+                recipes[item['recipe_id']] for item in page
+                if item['recipe_id'] in recipes
+            ],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        if not pk.isdigit():
+            raise NotFound
+        recipes = Recipe.objects.filter(similar_to__recipe=pk).annotate(
+            similarity=F('similar_to__score')
+        ).order_by('-similarity', 'id')
+        if not recipes and not Recipe.objects.filter(pk=pk).exists():
+            raise NotFound
+        return Response(SimilarRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        ).data)
+
+    @action(detail=False, methods=['post'], permission_classes=(AllowAny,))
+    def pantry_match(self, request):
+        """Рецепты из имеющихся ингредиентов по доле покрытия состава.
+
+        Фильтр по тегам – как у списка рецептов: ?tags=<slug>.
+        """
+        serializer = PantryMatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ingredients = serializer.validated_data['ingredients']
+        slugs = request.query_params.getlist('tags')
+        tags = None
+        if slugs:
+            tags = [
+                tag.id for tag in reference.tags.in_bulk(
+                    slugs, field='slug'
+                ).values()
+            ]
+        matches = pantry.index.match(
+            ingredients, tags, serializer.validated_data['limit']
+        )
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time'
+        ).in_bulk([pk for pk, *_ in matches])
+        result = []
+        for pk, have, total in matches:
+            if pk not in recipes:
+                continue
+            recipe = recipes[pk]
+            recipe.have, recipe.total = have, total
+            recipe.missing = sorted(
+                reference.ingredients.in_bulk(
+                    pantry.index.missing(pk, ingredients)
+                ).values(),
+                key=lambda row: row.name,
+            )
+            result.append(recipe)
+        return Response(PantryRecipeSerializer(
+            result, many=True, context=self.get_serializer_context()
+        ).data)
+
     @action(detail=True, methods=['post'])
     def favorite(self, request, pk):
-        data = {
-            'user': request.user.id,
-            'recipe': pk
-        }
-        return self.add_item(
-            FavoriteSerializer,
-            RecipeShortSerializer,
-            Recipe,
-            data,
-            request,
-            pk,
-        )
+        return self.add_recipes(request, Favorite, pk)
 
     @favorite.mapping.delete
     def unfavorite(self, request, pk):
-        return self.delete_item(Favorite, user=request.user, recipe=pk)
+        return self.remove_recipes(request, Favorite, pk)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='favorite',
+        url_name='favorite-many',
+        permission_classes=(IsAuthenticated,),
+    )
+    def favorite_many(self, request):
+        """Добавление в избранное рецептов из списка {"ids": [...]}."""
+        return self.add_recipes(request, Favorite)
+
+    @favorite_many.mapping.delete
+    def unfavorite_many(self, request):
+        return self.remove_recipes(request, Favorite)
 
     @action(detail=True, methods=['post'], url_path='shopping_cart')
     def add_to_cart(self, request, pk):
-        data = {
-            'user': request.user.id,
-            'recipe': pk
-        }
+        return self.add_recipes(request, ShoppingCart, pk)
+
+    @add_to_cart.mapping.delete
+    def remove_from_cart(self, request, pk):
+        return self.remove_recipes(request, ShoppingCart, pk)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        url_path='shopping_cart',
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_cart(self, request):
+        serializer = ShoppingCartIngredientSerializer(
+            ShoppingCartIngredient.objects.filter(
+                user=request.user
+            ).select_related('ingredient').order_by('ingredient__name'),
+            many=True,
+        )
+        return Response(serializer.data)
+
+    @shopping_cart.mapping.post
+    def add_many_to_cart(self, request):
+        """Добавление в список покупок рецептов из {"ids": [...]}."""
+        return self.add_recipes(request, ShoppingCart)
+
+    @shopping_cart.mapping.delete
+    def remove_many_from_cart(self, request):
+        return self.remove_recipes(request, ShoppingCart)
+
+    def add_recipes(self, request, model, pk=None):
+        add = partial(bulk.add_recipes, model, request.user.id)
+        errors = (
+            f'Рецепт уже добавлен в {model._meta.verbose_name}.',
+            'Рецепт не найден.',
+        )
+        if pk is None:
+            return self.add_items(request, add, *errors)
         return self.add_item(
-            ShoppingCartSerializer,
-            RecipeShortSerializer,
-            Recipe,
-            data,
             request,
             pk,
+            add,
+            # Только поля ответа, без полной выборки рецепта.
+            Recipe.objects.only(
+                'id', 'name', 'image', 'image_variants', 'cooking_time'
+            ),
+            RecipeShortSerializer,
+            *errors,
         )
 
-    @add_to_cart.mapping.delete
-    def remove_from_cart(self, request, pk):
-        return self.delete_item(ShoppingCart, user=request.user, recipe=pk)
+    def remove_recipes(self, request, model, pk=None):
+        remove = partial(bulk.remove_recipes, model, request.user.id)
+        error = f'Рецепта нет в {model._meta.verbose_name}.'
+        if pk is None:
+            return self.delete_items(request, remove, error)
+        return self.delete_item(pk, remove, error)
 
-    @action(methods=['get'], detail=False)
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        content_negotiation_class=IgnoreFormatNegotiation,
+    )
     def download_shopping_cart(self, request):
         user = request.user
-        items = RecipeIngredient.objects.filter(
-            recipe__shoppingcart__user=user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_CART_FORMATS:
+            data = {'errors': (
+                f'Доступные форматы: {", ".join(SHOPPING_CART_FORMATS)}.'
+            )}
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        etag = shopping_cart_etag(user, file_format)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
+        items = ShoppingCartIngredient.objects.filter(user=user).values(
+            'total',
             name=F('ingredient__name'),
             units=F('ingredient__measurement_unit'),
-            total=Sum('amount')
         ).order_by('name')
-        return create_shopping_cart(user, items)
+        response = create_shopping_cart(user, items, file_format)
+        response['ETag'] = etag
+        return response
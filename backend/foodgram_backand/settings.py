@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -48,9 +49,11 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,6 +100,25 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+RECIPE_CACHE_TIMEOUT = 60 * 60
+# Метрики запросов (/api/_metrics): доля замеряемых запросов и токен
+# сборщика (Authorization: Bearer <токен>); без токена доступа нет.
+METRICS_SAMPLE_RATE = env.float('METRICS_SAMPLE_RATE', default=1.0)
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+# Как часто процесс сверяет справочники в памяти с версией в кеше, сек.
+REFERENCE_CHECK_INTERVAL = 0.5
+
+# Очередь фоновых задач (manage.py run_worker)
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10
+JOB_LOCK_TIMEOUT = 10 * 60
+# Сколько хранить выполненные и проваленные задачи, сек.
+JOB_KEEP_FINISHED = 7 * 24 * 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -188,5 +210,30 @@ MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 3600
 MIN_AMOUNT = 1
 MAX_AMOUNT = 1000
+SEARCH_CONFIG = 'russian'
+RECIPE_IMAGE_WIDTHS = (300, 600, 1200)
 
 PAGE_SIZE_PAGINATION = 6
+MAX_PAGE_SIZE_PAGINATION = 100
+INGREDIENT_AUTOCOMPLETE_LIMIT = 20
+SUBSCRIPTION_RECIPES_LIMIT = 3
+SUBSCRIPTION_RECIPES_MAX_LIMIT = 50
+# Рецепты авторов с большим числом подписчиков читаются при запросе ленты
+FEED_FANOUT_LIMIT = 1000
+FEED_BACKFILL_LIMIT = 100
+SIMILAR_RECIPES_LIMIT = 10
+PANTRY_MATCH_LIMIT = 20
+PANTRY_MATCH_MAX_LIMIT = 100
+PANTRY_MAX_INGREDIENTS = 200
+# Запас при поиске изменённых рецептов: транзакция могла записать
+# updated_at раньше, чем её изменения стали видны.
+PANTRY_SYNC_MARGIN = 60
+# Сколько id принимают массовые добавления в избранное, список покупок
+# и подписки.
+BULK_MAX_IDS = 100
+# Популярность: вес добавления затухает вдвое за TRENDING_HALF_LIFE часов,
+# оценки пересчитываются фоновой задачей раз в TRENDING_INTERVAL секунд.
+TRENDING_HALF_LIFE = 48
+TRENDING_INTERVAL = 600
+TRENDING_FAVORITE_WEIGHT = 1
+TRENDING_SHOPPING_CART_WEIGHT = 1
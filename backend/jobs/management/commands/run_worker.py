@@ -0,0 +1,61 @@
+import signal
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from jobs.queue import claim, prune, registry, run
+
+PRUNE_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    help = ('Обработчик очереди фоновых задач. Запуск: '
+            'python manage.py run_worker [--sleep 1] [--burst]')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1,
+            help='Пауза в секундах, когда очередь пуста.',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Выполнить готовые задачи и завершиться.',
+        )
+
+    def stop(self, *args):
+        self.running = False
+
+    def prune(self):
+        # Старые завершённые задачи чистятся при запуске и раз в час.
+        if time.monotonic() - self.pruned_at < PRUNE_INTERVAL:
+            return
+        self.pruned_at = time.monotonic()
+        deleted = prune()
+        if deleted:
+            self.stdout.write(f'Удалено завершённых задач: {deleted}.')
+
+    def handle(self, *args, **options):
+        self.running = True
+        self.pruned_at = -PRUNE_INTERVAL
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.stdout.write(f'Задачи: {", ".join(sorted(registry))}.')
+        while self.running:
+            close_old_connections()
+            self.prune()
+            job = claim()
+            if job is None:
+                if options['burst']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+            start = time.perf_counter()
+            status = run(job)
+            self.stdout.write(
+                f'{job.name} #{job.id}: {status}, попытка {job.attempts}, '
+                f'{(time.perf_counter() - start) * 1000:.0f} мс'
+            )
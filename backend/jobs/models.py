@@ -0,0 +1,88 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        verbose_name='Задача',
+        max_length=200,
+    )
+    args = models.JSONField(
+        verbose_name='Аргументы',
+        default=list,
+    )
+    kwargs = models.JSONField(
+        verbose_name='Именованные аргументы',
+        default=dict,
+    )
+    key = models.CharField(
+        verbose_name='Ключ идемпотентности',
+        max_length=255,
+        unique=True,
+        null=True,
+        blank=True,
+    )
+    priority = models.SmallIntegerField(
+        verbose_name='Приоритет',
+        default=0,
+    )
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток',
+        default=0,
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Максимум попыток',
+    )
+    run_at = models.DateTimeField(
+        verbose_name='Запуск не раньше',
+        default=timezone.now,
+    )
+    locked_at = models.DateTimeField(
+        verbose_name='Взята в работу',
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Создана',
+        auto_now_add=True,
+    )
+    finished_at = models.DateTimeField(
+        verbose_name='Завершена',
+        null=True,
+        blank=True,
+    )
+    last_error = models.TextField(
+        verbose_name='Последняя ошибка',
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ('-id',)
+        indexes = (
+            models.Index(
+                fields=('status', '-priority', 'run_at'),
+                name='job_queue_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
@@ -0,0 +1,137 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+class Task:
+    """Функция, которую можно выполнить сразу или поставить в очередь."""
+
+    def __init__(self, func, name, priority, max_attempts):
+        self.func = func
+        self.name = name
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, key=None, priority=None, countdown=0, **kwargs):
+        """Ставит задачу в очередь в текущей транзакции.
+
+        Пока задача с ключом key ждёт или выполняется, повторно она не
+        создаётся, возвращается существующая. Завершённая или
+        проваленная задача с тем же ключом ставится в очередь заново.
+        """
+        fields = {
+            'name': self.name,
+            'args': list(args),
+            'kwargs': kwargs,
+            'priority': self.priority if priority is None else priority,
+            'max_attempts': self.max_attempts,
+            'run_at': timezone.now() + timedelta(seconds=countdown),
+        }
+        if key is None:
+            return Job.objects.create(**fields)
+        job, created = Job.objects.get_or_create(key=key, defaults=fields)
+        if created or job.status in (Job.PENDING, Job.RUNNING):
+            return job
+        # Условие на статус: из двух параллельных вызовов задачу
+        # перезапускает один.
+        fields.update(status=Job.PENDING, attempts=0, locked_at=None,
+                      finished_at=None, last_error='')
+        Job.objects.filter(id=job.id, status=job.status).update(**fields)
+        job.refresh_from_db()
+        return job
+
+
+def task(name=None, priority=0, max_attempts=None):
+    """Регистрирует функцию как фоновую задачу."""
+
+    def decorator(func):
+        task = Task(
+            func,
+            name or f'{func.__module__}.{func.__name__}',
+            priority,
+            max_attempts or settings.JOB_MAX_ATTEMPTS,
+        )
+        registry[task.name] = task
+        return task
+
+    return decorator
+
+
+def claim():
+    """Забирает в работу самую приоритетную из готовых задач.
+
+    Задачи, зависшие в работе дольше JOB_LOCK_TIMEOUT (упавший
+    обработчик), считаются свободными. Параллельные обработчики
+    пропускают строки, заблокированные друг другом.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Job.PENDING, run_at__lte=now)
+            | Q(status=Job.RUNNING, locked_at__lt=stale)
+        ).order_by('-priority', 'run_at', 'id').first()
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.locked_at = now
+        job.attempts += 1
+        job.save(update_fields=('status', 'locked_at', 'attempts'))
+    return job
+
+
+def run(job):
+    """Выполняет задачу; при ошибке откладывает повтор с экспоненциальной
+    задержкой, после max_attempts попыток помечает как проваленную."""
+    try:
+        task = registry[job.name]
+    except KeyError:
+        job.status = Job.FAILED
+        job.last_error = f'Неизвестная задача {job.name}.'
+    else:
+        try:
+            task(*job.args, **job.kwargs)
+        except Exception:
+            job.last_error = traceback.format_exc()
+            logger.exception('Задача %s #%s завершилась ошибкой',
+                             job.name, job.id)
+            if job.attempts >= job.max_attempts:
+                job.status = Job.FAILED
+            else:
+                job.status = Job.PENDING
+                job.run_at = timezone.now() + timedelta(
+                    seconds=settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+                )
+        else:
+            job.status = Job.DONE
+    if job.status != Job.PENDING:
+        job.finished_at = timezone.now()
+    job.locked_at = None
+    job.save(update_fields=(
+        'status', 'run_at', 'locked_at', 'finished_at', 'last_error'
+    ))
+    return job.status
+
+
+def prune():
+    """Удаляет задачи, завершённые раньше чем JOB_KEEP_FINISHED назад."""
+    return Job.objects.filter(
+        status__in=(Job.DONE, Job.FAILED),
+        finished_at__lt=timezone.now() - timedelta(
+            seconds=settings.JOB_KEEP_FINISHED
+        ),
+    ).delete()[0]
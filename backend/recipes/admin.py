@@ -6,8 +6,11 @@ from recipes.models import (
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingCartIngredient,
     Tag,
 )
+from recipes.shopping_cart import changing_recipes
+from recipes.tasks import refresh_similar_recipes
 
 admin.site.site_header = 'Администрирование Foodgram'
 
@@ -36,14 +39,19 @@ class RecipeAdmin(admin.ModelAdmin):
         'name',
         'author',
         'favorites_count',
+        'shopping_cart_count',
     )
     search_fields = ('name', 'author', 'tags')
     list_filter = ('name', 'author', 'tags')
     inlines = (RecipeIngredientInline,)
+    list_select_related = ('author',)
 
-    @admin.display(description='в избранном')
-    def favorites_count(self, recipe):
-        return recipe.favorite.count()
+    def save_related(self, request, form, formsets, change):
+        if not change:
+            return super().save_related(request, form, formsets, change)
+        with changing_recipes([form.instance.id]):
+            super().save_related(request, form, formsets, change)
+        refresh_similar_recipes.enqueue(form.instance.id)
 
 
 @admin.register(Ingredient)
@@ -57,6 +65,34 @@ class IngredientAdmin(admin.ModelAdmin):
     list_filter = ('name',)
 
 
-admin.site.register(RecipeIngredient)
+@admin.register(RecipeIngredient)
+class RecipeIngredientAdmin(admin.ModelAdmin):
+    list_select_related = ('recipe', 'ingredient')
+
+    def refresh_similar(self, recipe_ids):
+        for recipe in recipe_ids:
+            refresh_similar_recipes.enqueue(recipe)
+
+    def save_model(self, request, obj, form, change):
+        recipes = {obj.recipe_id}
+        if change:
+            recipes.add(form.initial['recipe'])
+        with changing_recipes(recipes):
+            super().save_model(request, obj, form, change)
+        self.refresh_similar(recipes)
+
+    def delete_model(self, request, obj):
+        with changing_recipes([obj.recipe_id]):
+            super().delete_model(request, obj)
+        self.refresh_similar([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipes = set(queryset.values_list('recipe_id', flat=True))
+        with changing_recipes(recipes):
+            super().delete_queryset(request, queryset)
+        self.refresh_similar(recipes)
+
+
 admin.site.register(Favorite)
 admin.site.register(ShoppingCart)
+admin.site.register(ShoppingCartIngredient)
@@ -0,0 +1,120 @@
+from array import array
+from bisect import bisect_left
+from threading import Lock
+
+from django.db import connection
+from django.db.models import Case, IntegerField, When
+
+from recipes.reference import ingredients
+
+NGRAM_SIZE = 3
+
+
+def ngrams(text):
+    return {
+        text[index:index + NGRAM_SIZE]
+        for index in range(len(text) - NGRAM_SIZE + 1)
+    }
+
+
+class IngredientIndex:
+    """Префиксный и триграммный индекс названий ингредиентов в памяти.
+
+    Позиции строк соответствуют порядку названий, поэтому списки
+    позиций в триграммах уже отсортированы так же, как выдача БД.
+    """
+
+    def __init__(self, rows):
+        rows = sorted((name.casefold(), pk) for pk, name in rows)
+        self.names = [name for name, _ in rows]
+        self.ids = [pk for _, pk in rows]
+        self.postings = {}
+        for position, name in enumerate(self.names):
+            for gram in ngrams(name):
+                self.postings.setdefault(gram, array('I')).append(position)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def prefix(self, value, limit):
+        position = bisect_left(self.names, value)
+        result = []
+        while (
+            len(result) < limit
+            and position < len(self.names)
+            and self.names[position].startswith(value)
+        ):
+            result.append(position)
+            position += 1
+        return result
+
+    def substring(self, value, limit):
+        grams = ngrams(value)
+        if grams:
+            candidates = min(
+                (self.postings.get(gram, ()) for gram in grams), key=len
+            )
+        else:
+            candidates = range(len(self.names))
+        result = []
+        for position in candidates:
+            name = self.names[position]
+            if value in name and not name.startswith(value):
+                result.append(position)
+                if len(result) >= limit:
+                    break
+        return result
+
+    def search(self, value, limit):
+        value = value.casefold()
+        positions = self.prefix(value, limit)
+        if len(positions) < limit:
+            positions += self.substring(value, limit - len(positions))
+        return [self.ids[position] for position in positions]
+
+
+_index = None
+_index_rows = None
+_index_lock = Lock()
+
+
+def get_index():
+    """Индекс по справочнику ингредиентов в памяти; перестраивается,
+    когда справочник перечитан."""
+    global _index, _index_rows
+    rows = ingredients.all()
+    with _index_lock:
+        if rows is not _index_rows:
+            _index = IngredientIndex((row.id, row.name) for row in rows)
+            _index_rows = rows
+        return _index
+
+
+def reset_index():
+    ingredients.invalidate()
+
+
+def autocomplete(queryset, value, limit):
+    """Ингредиенты по вхождению строки: сначала совпадения с начала
+    названия, затем остальные; не более limit строк.
+
+    В PostgreSQL запрос обслуживает GIN-индекс pg_trgm,
+    в остальных БД – индекс в памяти процесса.
+    """
+    if connection.vendor == 'postgresql':
+        return queryset.filter(name__icontains=value).annotate(
+            is_prefix=Case(
+                When(name__istartswith=value, then=0),
+                default=1,
+                output_field=IntegerField(),
+            )
+        ).order_by('is_prefix', 'name')[:limit]
+    ids = get_index().search(value, limit)
+    if not ids:
+        return queryset.none()
+    return queryset.filter(id__in=ids).order_by(
+        Case(
+            *[When(id=pk, then=rank) for rank, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+    )
@@ -0,0 +1,151 @@
+"""Добавления и удаления в обход save() и delete(), одним запросом на
+любое число строк.
+
+Сигналы моделей при этом не срабатывают, поэтому счётчики, списки
+покупок и ленты обновляются здесь сразу для всех строк, а остальным
+сообщает сигнал rows_changed.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from recipes.counters import change_counters
+from recipes.models import FeedItem, Recipe, ShoppingCart
+from recipes.shopping_cart import add_recipes as add_to_cart
+from recipes.shopping_cart import remove_recipes as remove_from_cart
+from recipes.signals import COUNTER_FIELDS, rows_changed
+from recipes.tasks import backfill_feeds
+from users.models import Follow
+
+User = get_user_model()
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def insert(model, owner, target, owner_id, target_ids):
+    """INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING.
+
+    Несуществующие и уже связанные с owner_id цели пропускаются без
+    отдельной проверки. Возвращает id целей вставленных строк.
+    """
+    owner = model._meta.get_field(owner)
+    target = model._meta.get_field(target)
+    columns = [owner.column, target.column]
+    values = ['%s', 'id']
+    params = [owner_id]
+    now = timezone.now()
+    for field in model._meta.concrete_fields:
+        if getattr(field, 'auto_now_add', False):
+            columns.append(field.column)
+            values.append('%s')
+            params.append(field.get_db_prep_save(now, connection))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {model._meta.db_table} ({", ".join(columns)}) '
+            f'SELECT {", ".join(values)} '
+            f'FROM {target.related_model._meta.db_table} '
+            f'WHERE id IN ({placeholders(target_ids)}) '
+            f'ON CONFLICT DO NOTHING RETURNING {target.column}',
+            params + list(target_ids),
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def delete(model, owner, target, owner_id, target_ids):
+    """DELETE ... RETURNING, возвращает id целей удалённых строк."""
+    owner = model._meta.get_field(owner)
+    target = model._meta.get_field(target)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {model._meta.db_table} '
+            f'WHERE {owner.column} = %s '
+            f'AND {target.column} IN ({placeholders(target_ids)}) '
+            f'RETURNING {target.column}',
+            [owner_id, *target_ids],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def linked(model, owner, target, owner_id, target_ids):
+    """Те из target_ids, что уже связаны с owner_id."""
+    if not target_ids:
+        return set()
+    return set(model.objects.filter(**{
+        owner: owner_id, f'{target}__in': target_ids,
+    }).values_list(f'{target}_id', flat=True))
+
+
+@transaction.atomic
+def add_recipes(model, user_id, recipe_ids):
+    """Добавляет рецепты в избранное или список покупок.
+
+    Возвращает (добавленные, уже добавленные); несуществующих рецептов
+    нет ни там, ни там. Уже добавленные ищутся, только если вставлено
+    не всё.
+    """
+    created = insert(model, 'user', 'recipe', user_id, recipe_ids)
+    if created:
+        change_counters(Recipe, created, COUNTER_FIELDS[model], 1)
+        if model is ShoppingCart:
+            add_to_cart(user_id, created)
+        rows_changed.send(
+            sender=model, user_id=user_id, target_ids=created
+        )
+    rest = set(recipe_ids) - created
+    return created, linked(model, 'user', 'recipe', user_id, rest)
+
+
+@transaction.atomic
+def remove_recipes(model, user_id, recipe_ids):
+    """Убирает рецепты из избранного или списка покупок, возвращает
+    id убранных."""
+    removed = delete(model, 'user', 'recipe', user_id, recipe_ids)
+    if removed:
+        if model is ShoppingCart:
+            remove_from_cart(user_id, removed)
+        change_counters(Recipe, removed, COUNTER_FIELDS[model], -1)
+        rows_changed.send(
+            sender=model, user_id=user_id, target_ids=removed
+        )
+    return removed
+
+
+@transaction.atomic
+def follow(follower_id, author_ids):
+    """Подписывает на авторов, возвращает (новые подписки, уже
+    существующие); подписка на себя пропускается."""
+    author_ids = [pk for pk in author_ids if pk != follower_id]
+    if not author_ids:
+        return set(), set()
+    created = insert(
+        Follow, 'follower', 'following', follower_id, author_ids
+    )
+    if created:
+        change_counters(User, created, 'followers_count', 1)
+        backfill_feeds.enqueue(follower_id, sorted(created))
+        rows_changed.send(
+            sender=Follow, user_id=follower_id, target_ids=created
+        )
+    rest = set(author_ids) - created
+    return created, linked(
+        Follow, 'follower', 'following', follower_id, rest
+    )
+
+
+@transaction.atomic
+def unfollow(follower_id, author_ids):
+    """Отменяет подписки, возвращает id авторов, от которых отписался."""
+    removed = delete(
+        Follow, 'follower', 'following', follower_id, author_ids
+    )
+    if removed:
+        change_counters(User, removed, 'followers_count', -1)
+        FeedItem.objects.filter(
+            user=follower_id, author__in=removed
+        ).delete()
+        rows_changed.send(
+            sender=Follow, user_id=follower_id, target_ids=removed
+        )
+    return removed
@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow
+
+User = get_user_model()
+
+# (модель со счётчиком, поле счётчика, подсчитываемая модель, внешний ключ)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def actual_count(source, fk):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+def recount():
+    """Пересчитывает все счётчики, возвращает число исправленных строк
+    для каждого из них."""
+    drift = {}
+    for model, field, source, fk in COUNTERS:
+        drift[f'{model.__name__}.{field}'] = model.objects.annotate(
+            actual=actual_count(source, fk)
+        ).exclude(**{field: F('actual')}).count()
+        model.objects.update(**{field: actual_count(source, fk)})
+    return drift
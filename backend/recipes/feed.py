@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F
+
+from recipes.models import FeedItem, Recipe
+from users.models import Follow
+
+User = get_user_model()
+
+
+def is_fanned_out(author):
+    """Рецепты авторов с большим числом подписчиков в ленты не
+    раскладываются, а читаются из таблицы рецептов при запросе."""
+    return author.followers_count <= settings.FEED_FANOUT_LIMIT
+
+
+def fan_out(recipe):
+    if not is_fanned_out(recipe.author):
+        return 0
+    items = [
+        FeedItem(
+            user_id=follower,
+            recipe_id=recipe.id,
+            author_id=recipe.author_id,
+            pub_date=recipe.pub_date,
+        )
+        for follower in Follow.objects.filter(
+            following=recipe.author_id
+        ).values_list('follower_id', flat=True)
+    ]
+    FeedItem.objects.bulk_create(
+        items, batch_size=1000, ignore_conflicts=True
+    )
+    return len(items)
+
+
+def backfill(follower_id, author):
+    """Последние рецепты автора в ленту нового подписчика."""
+    if not is_fanned_out(author):
+        return 0
+    recipes = Recipe.objects.filter(author=author).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_LIMIT]
+    items = [
+        FeedItem(
+            user_id=follower_id,
+            recipe_id=recipe_id,
+            author_id=author.id,
+            pub_date=pub_date,
+        )
+        for recipe_id, pub_date in recipes
+    ]
+    FeedItem.objects.bulk_create(items, ignore_conflicts=True)
+    return len(items)
+
+
+def remove(follower_id, author_id):
+    return FeedItem.objects.filter(
+        user=follower_id, author=author_id
+    ).delete()[0]
+
+
+def get_feed(user):
+    """Части ленты пользователя: записи из таблицы лент и рецепты
+    авторов, которые в ленты не раскладываются."""
+    big_authors = list(User.objects.filter(
+        following__follower=user,
+        followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).values_list('id', flat=True))
+    timeline = FeedItem.objects.filter(user=user).values(
+        'pub_date', 'recipe_id'
+    )
+    if not big_authors:
+        return [timeline]
+    return [
+        timeline.exclude(author__in=big_authors),
+        Recipe.objects.filter(author__in=big_authors).values(
+            'pub_date', recipe_id=F('id')
+        ),
+    ]
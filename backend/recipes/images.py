@@ -0,0 +1,96 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+EXIF_ORIENTATION = 0x0112
+
+
+def variant_name(name, width, extension):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}_w{width}.{extension}'
+
+
+def variant_widths(width):
+    """Ширины копий оригинала шириной width.
+
+    thumbnail не увеличивает изображение, поэтому ширины из
+    RECIPE_IMAGE_WIDTHS не меньше width заменяет одна копия в width.
+    """
+    widths = [w for w in settings.RECIPE_IMAGE_WIDTHS if w < width]
+    if len(widths) < len(settings.RECIPE_IMAGE_WIDTHS):
+        widths.append(width)
+    return widths
+
+
+def build_variants(image):
+    """Создаёт недостающие уменьшенные копии рядом с оригиналом.
+
+    Возвращает число созданных файлов и ширины всех копий оригинала.
+    """
+    if not image or not image.storage.exists(image.name):
+        return 0, []
+    storage = image.storage
+    with storage.open(image.name, 'rb') as file:
+        source = Image.open(file)
+        # Ориентации 5–8 поворачивают изображение на 90°.
+        turned = source.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8)
+        widths = variant_widths(source.height if turned else source.width)
+        missing = [
+            (width, extension)
+            for width in widths
+            for extension in FORMATS
+            if not storage.exists(variant_name(image.name, width, extension))
+        ]
+        if not missing:
+            return 0, widths
+        original = ImageOps.exif_transpose(source)
+        original.load()
+    original = original.convert('RGB')
+    for width, extension in missing:
+        variant = original.copy()
+        variant.thumbnail((width, width * 4), Image.LANCZOS)
+        buffer = BytesIO()
+        image_format, options = FORMATS[extension]
+        variant.save(buffer, image_format, **options)
+        storage.save(
+            variant_name(image.name, width, extension),
+            ContentFile(buffer.getvalue()),
+        )
+    return len(missing), widths
+
+
+def delete_variants(storage, name, widths):
+    """Удаляет копии оригинала name, например после замены изображения."""
+    for width in widths:
+        for extension in FORMATS:
+            storage.delete(variant_name(name, width, extension))
+
+
+def srcset(image, variants, build_url):
+    """{'webp': 'url 300w, url 600w, ...', 'jpeg': ...} для srcset.
+
+    Только по копиям из записи variants и только если она сделана для
+    текущего оригинала: до конца сборки копий srcset пуст.
+    """
+    if not image or variants.get('name') != image.name:
+        return {}
+
+    def url(width, extension):
+        return build_url(
+            image.storage.url(variant_name(image.name, width, extension))
+        )
+
+    return {
+        extension: ', '.join(
+            f'{url(width, extension)} {width}w'
+            for width in variants['widths']
+        )
+        for extension in FORMATS
+    }
@@ -0,0 +1,92 @@
+import csv
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.autocomplete import IngredientIndex, autocomplete, reset_index
+from recipes.models import Ingredient
+
+FILE: str = f'{settings.BASE_DIR}/data/ingredients.csv'
+QUERIES = ('а', 'мол', 'сыр', 'кури', 'масло', 'ово', 'перец черный')
+
+
+def scaled_rows(rows):
+    with open(FILE, 'r', encoding='utf-8') as file:
+        source = list(csv.reader(file))
+    for number in range(rows):
+        name, unit = source[number % len(source)]
+        copy = number // len(source)
+        yield number + 1, (f'{name} {copy}' if copy else name), unit
+
+
+def percentile(timings, share):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * share))]
+
+
+class Command(BaseCommand):
+    help = ('Замер автодополнения ингредиентов на данных '
+            'data/ingredients.csv, размноженных до --rows строк. Запуск: '
+            'python manage.py bench_autocomplete --rows 1000000')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument(
+            '--backend',
+            choices=('memory', 'db'),
+            default='memory',
+            help='memory – индекс в памяти, db – запрос к текущей БД '
+                 '(строки вставляются в транзакции и откатываются).',
+        )
+
+    def measure(self, search, repeat):
+        limit = settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        search(QUERIES[0], limit)
+        for query in QUERIES:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                search(query, limit)
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f'{query!r:>16} p50={statistics.median(timings):.3f} мс '
+                f'p99={percentile(timings, 0.99):.3f} мс'
+            )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        start = time.perf_counter()
+        if options['backend'] == 'memory':
+            index = IngredientIndex(
+                (pk, name) for pk, name, _ in scaled_rows(rows)
+            )
+            self.stdout.write(
+                f'Индекс на {len(index)} строк построен за '
+                f'{time.perf_counter() - start:.1f} сек.'
+            )
+            self.measure(index.search, options['repeat'])
+            return
+        with transaction.atomic():
+            Ingredient.objects.all().delete()
+            Ingredient.objects.bulk_create(
+                (Ingredient(id=pk, name=name, measurement_unit=unit)
+                 for pk, name, unit in scaled_rows(rows)),
+                batch_size=5000,
+            )
+            self.stdout.write(
+                f'{rows} строк загружено за '
+                f'{time.perf_counter() - start:.1f} сек.'
+            )
+            reset_index()
+            self.measure(
+                lambda query, limit: list(
+                    autocomplete(Ingredient.objects.all(), query, limit)
+                ),
+                options['repeat'],
+            )
+            transaction.set_rollback(True)
+        reset_index()
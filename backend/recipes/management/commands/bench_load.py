@@ -0,0 +1,298 @@
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer,
+    WSGIRequestHandler,
+    get_internal_wsgi_application,
+)
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.management.commands.seed_bench import EMAIL_DOMAIN
+from recipes.models import Recipe, Tag
+
+User = get_user_model()
+
+# Доли операций в смеси по умолчанию.
+MIX = {
+    'anon_list': 30,
+    'auth_list': 20,
+    'detail': 25,
+    'favorite': 8,
+    'shopping_cart': 5,
+    'download_shopping_cart': 2,
+    'subscriptions': 5,
+    'feed': 5,
+}
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    """Многопоточный WSGI-сервер приложения в фоновом потоке."""
+    server = ThreadedWSGIServer(
+        ('127.0.0.1', 0), QuietHandler, allow_reuse_address=False
+    )
+    server.set_app(get_internal_wsgi_application())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class TimedSession(requests.Session):
+    """Сессия, замеряющая время запроса вместе с чтением тела."""
+
+    def request(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().request(*args, **kwargs)
+        response.duration = (time.perf_counter() - start) * 1000
+        return response
+
+
+def percentile(values, share):
+    """Значение с рангом ceil(share * n) среди отсортированных."""
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+class Traffic:
+    """Операции смеси: каждая делает один-два HTTP-запроса и
+    возвращает их как (эндпоинт, ответ)."""
+
+    def __init__(self, url, host, tokens, recipes, tags):
+        self.url = url
+        self.host = host
+        self.tokens = tokens
+        self.recipes = recipes
+        self.tags = tags
+        # Популярные рецепты запрашивают чаще, как в жизни.
+        self.weights = [1 / rank for rank in range(1, len(recipes) + 1)]
+
+    def session(self, token=None):
+        session = TimedSession()
+        session.headers['Host'] = self.host
+        if token:
+            session.headers['Authorization'] = f'Token {token}'
+        return session
+
+    def recipe(self, generator):
+        return generator.choices(self.recipes, self.weights)[0]
+
+    def anon_list(self, client, anon, generator):
+        return [('anon_list', anon.get(
+            f'{self.url}/api/recipes/',
+            params={'page': generator.randint(1, 5), 'limit': 6},
+        ))]
+
+    def auth_list(self, client, anon, generator):
+        params = {'limit': 6, 'tags': generator.sample(
+            self.tags, generator.randint(1, len(self.tags))
+        )}
+        if generator.random() < 0.3:
+            params['is_favorited'] = 1
+        return [('auth_list', client.get(
+            f'{self.url}/api/recipes/', params=params
+        ))]
+
+    def detail(self, client, anon, generator):
+        session = client if generator.random() < 0.5 else anon
+        return [('detail', session.get(
+            f'{self.url}/api/recipes/{self.recipe(generator)}/'
+        ))]
+
+    def toggle(self, client, generator, name, path):
+        url = f'{self.url}/api/recipes/{self.recipe(generator)}/{path}/'
+        added = client.post(url)
+        removed = client.delete(url)
+        result = [(f'{name}_add', added), (f'{name}_remove', removed)]
+        if added.status_code == 400:
+            # Рецепт уже был добавлен: возвращаем как было.
+            result.append((f'{name}_add', client.post(url)))
+        return result
+
+    def favorite(self, client, anon, generator):
+        return self.toggle(client, generator, 'favorite', 'favorite')
+
+    def shopping_cart(self, client, anon, generator):
+        return self.toggle(
+            client, generator, 'shopping_cart', 'shopping_cart'
+        )
+
+    def download_shopping_cart(self, client, anon, generator):
+        return [('download_shopping_cart', client.get(
+            f'{self.url}/api/recipes/download_shopping_cart/'
+        ))]
+
+    def subscriptions(self, client, anon, generator):
+        return [('subscriptions', client.get(
+            f'{self.url}/api/users/subscriptions/',
+            params={'recipes_limit': 3},
+        ))]
+
+    def feed(self, client, anon, generator):
+        return [('feed', client.get(f'{self.url}/api/recipes/feed/'))]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер смеси запросов к API на данных seed_bench. '
+            'Печатает JSON с пропускной способностью и p50/p95/p99 по '
+            'эндпоинтам. Запуск: python manage.py bench_load '
+            '[--duration 30] [--concurrency 8] [--url http://...] '
+            '[--output run.json]')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера; по умолчанию сервер '
+                 'поднимается в этом же процессе.',
+        )
+        parser.add_argument(
+            '--users', type=int, default=50,
+            help='Сколько пользователей seed_bench делают запросы.',
+        )
+        parser.add_argument(
+            '--mix', nargs='+', default=[],
+            help='Доли операций: anon_list=50 detail=50 ...',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для JSON-результата.')
+
+    def get_mix(self, values):
+        mix = dict(MIX)
+        if values:
+            mix = {}
+            for value in values:
+                name, _, weight = value.partition('=')
+                if name not in MIX or not weight.isdigit():
+                    raise CommandError(
+                        f'Неверная доля {value}, операции: '
+                        f'{", ".join(MIX)}.'
+                    )
+                mix[name] = int(weight)
+        return {name: weight for name, weight in mix.items() if weight}
+
+    def handle(self, *args, **options):
+        mix = self.get_mix(options['mix'])
+        users = list(User.objects.filter(
+            email__endswith=f'@{EMAIL_DOMAIN}'
+        ).order_by('id')[:options['users']])
+        if not users:
+            raise CommandError('Нет данных: python manage.py seed_bench')
+        tokens = [Token.objects.get_or_create(user=user)[0].key
+                  for user in users]
+        recipes = list(Recipe.objects.filter(
+            author__email__endswith=f'@{EMAIL_DOMAIN}'
+        ).order_by('-favorites_count', 'id').values_list('id', flat=True))
+        tags = list(Tag.objects.values_list('slug', flat=True))
+        server = None
+        url = options['url']
+        if url is None:
+            server, url = start_server()
+        host = next(
+            (host.lstrip('.') for host in settings.ALLOWED_HOSTS
+             if '*' not in host),
+            url.split('//', 1)[-1],
+        )
+        traffic = Traffic(url.rstrip('/'), host, tokens, recipes, tags)
+        samples = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['duration']
+
+        def worker(number):
+            generator = random.Random(options['seed'] * 1000 + number)
+            client = traffic.session(tokens[number % len(tokens)])
+            anon = traffic.session()
+            names, weights = zip(*mix.items())
+            local = []
+            while time.perf_counter() < deadline:
+                operation = getattr(
+                    traffic, generator.choices(names, weights)[0]
+                )
+                try:
+                    responses = operation(client, anon, generator)
+                except requests.RequestException:
+                    local.append(('connection_error', 0, 0))
+                    continue
+                local.extend(
+                    (name, response.status_code, response.duration)
+                    for name, response in responses
+                )
+            with lock:
+                samples.extend(local)
+
+        started_at = timezone.now()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            list(executor.map(worker, range(options['concurrency'])))
+        elapsed = time.perf_counter() - start
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        result = self.summarize(samples, elapsed)
+        result.update({
+            'started_at': started_at.isoformat(),
+            'url': url if server is None else 'in-process',
+            'duration_s': round(elapsed, 2),
+            'concurrency': options['concurrency'],
+            'users': len(users),
+            'recipes': len(recipes),
+            'mix': mix,
+        })
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
+
+    @staticmethod
+    def summarize(samples, elapsed):
+        endpoints = {}
+        for name, status, milliseconds in samples:
+            endpoint = endpoints.setdefault(
+                name, {'timings': [], 'statuses': {}}
+            )
+            endpoint['timings'].append(milliseconds)
+            endpoint['statuses'][status] = (
+                endpoint['statuses'].get(status, 0) + 1
+            )
+        summary = {}
+        for name, endpoint in sorted(endpoints.items()):
+            timings = sorted(endpoint['timings'])
+            # 0 – ответа нет совсем.
+            errors = sum(
+                count for status, count in endpoint['statuses'].items()
+                if status == 0 or status >= 500
+            )
+            summary[name] = {
+                'requests': len(timings),
+                'errors': errors,
+                'throughput_rps': round(len(timings) / elapsed, 2),
+                'mean_ms': round(sum(timings) / len(timings), 2),
+                'p50_ms': round(percentile(timings, 0.50), 2),
+                'p95_ms': round(percentile(timings, 0.95), 2),
+                'p99_ms': round(percentile(timings, 0.99), 2),
+                'statuses': {
+                    str(status): count
+                    for status, count in sorted(endpoint['statuses'].items())
+                },
+            }
+        return {
+            'requests': len(samples),
+            'errors': sum(item['errors'] for item in summary.values()),
+            'throughput_rps': round(len(samples) / elapsed, 2),
+            'endpoints': summary,
+        }
@@ -0,0 +1,115 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.pagination import KeysetPagination, LimitPageNumberPagination
+from recipes.models import Recipe
+
+User = get_user_model()
+AUTHORS = 1000
+
+
+def fill_recipes(rows):
+    User.objects.bulk_create(
+        User(email=f'bench{number}@bench.local', username=f'bench{number}')
+        for number in range(AUTHORS)
+    )
+    authors = list(User.objects.filter(email__endswith='@bench.local'))
+    now = timezone.now()
+    for start in range(0, rows, 10000):
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {number}',
+                text='Текст рецепта',
+                author=authors[number % AUTHORS],
+                image='recipe_images/bench.png',
+                cooking_time=10,
+            )
+            for number in range(start, min(start + 10000, rows))
+        )
+    # pub_date выставляет auto_now_add, поэтому разносим его блоками:
+    # внутри блока даты совпадают и порядок задаёт id.
+    first = Recipe.objects.filter(
+        author__in=authors
+    ).order_by('id').values_list('id', flat=True)[0]
+    for block, pk in enumerate(range(first, first + rows, 10000)):
+        Recipe.objects.filter(id__gte=pk, id__lt=pk + 10000).update(
+            pub_date=now - timedelta(minutes=block)
+        )
+
+
+class Command(BaseCommand):
+    help = ('Сравнение постраничного вывода рецептов по номерам страниц '
+            'и по ключевому курсору. Запуск: '
+            'python manage.py bench_pagination --recipes 1000000')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1_000_000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--pages', type=int, nargs='+', default=[1, 100, 10000, 100000]
+        )
+
+    def measure(self, paginator_class, params, repeat):
+        """Медиана и максимум времени, а также id рецептов страницы."""
+        request = Request(APIRequestFactory().get('/api/recipes/', params))
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            page = paginator_class().paginate_queryset(
+                Recipe.objects.all(), request
+            )
+            timings.append((time.perf_counter() - start) * 1000)
+        return (
+            statistics.median(timings),
+            max(timings),
+            [recipe.id for recipe in page],
+        )
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        with transaction.atomic():
+            start = time.perf_counter()
+            fill_recipes(options['recipes'])
+            self.stdout.write(
+                f'{options["recipes"]} рецептов создано за '
+                f'{time.perf_counter() - start:.1f} сек.'
+            )
+            keyset = KeysetPagination()
+            for page in options['pages']:
+                offset = (page - 1) * limit
+                if offset >= options['recipes']:
+                    continue
+                numbered = self.measure(
+                    LimitPageNumberPagination,
+                    {'page': page, 'limit': limit},
+                    options['repeat'],
+                )
+                params = {'cursor': '', 'limit': limit}
+                if offset:
+                    params['cursor'] = keyset.encode_cursor(
+                        Recipe.objects.order_by('-pub_date', '-id')[offset - 1]
+                    )
+                cursor = self.measure(
+                    KeysetPagination, params, options['repeat']
+                )
+                if cursor[2] != numbered[2]:
+                    raise CommandError(
+                        f'Страница {page} по курсору не совпадает '
+                        f'со страницей по номеру.'
+                    )
+                self.stdout.write(
+                    f'страница {page:>7}: '
+                    f'номер p50={numbered[0]:.2f} мс max={numbered[1]:.2f} мс'
+                    f' | курсор p50={cursor[0]:.2f} мс '
+                    f'max={cursor[1]:.2f} мс'
+                )
+            transaction.set_rollback(True)
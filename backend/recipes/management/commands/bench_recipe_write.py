@@ -0,0 +1,103 @@
+import base64
+import statistics
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+def sample_image():
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+def ingredient_ids(count):
+    ids = list(Ingredient.objects.values_list('id', flat=True)[:count])
+    if len(ids) < count:
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(count - len(ids))
+        )
+        ids = list(Ingredient.objects.values_list('id', flat=True)[:count])
+    return ids
+
+
+class Command(BaseCommand):
+    help = ('Число запросов и время создания рецепта в зависимости от '
+            'числа ингредиентов. Запуск: '
+            'python manage.py bench_recipe_write [--sizes 5 50 200]')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[5, 50, 200]
+        )
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        host = next(
+            (host.lstrip('.') for host in settings.ALLOWED_HOSTS
+             if '*' not in host),
+            'testserver',
+        )
+        client = APIClient(HTTP_HOST=host)
+        image = sample_image()
+        created = []
+        with transaction.atomic():
+            author = User.objects.create_user(
+                email='bench-writer@bench.local',
+                username='bench-writer',
+                first_name='Bench',
+                last_name='Writer',
+            )
+            client.force_authenticate(author)
+            tags = list(Tag.objects.values_list('id', flat=True)[:3]) or [
+                Tag.objects.create(name='Бенчмарк', slug='bench').id
+            ]
+            ids = ingredient_ids(max(options['sizes']))
+            for size in options['sizes']:
+                timings, queries = [], set()
+                for number in range(options['repeat']):
+                    data = {
+                        'name': f'Рецепт {size}-{number}',
+                        'text': 'Текст рецепта',
+                        'cooking_time': 10,
+                        'image': image,
+                        'tags': tags,
+                        'ingredients': [
+                            {'id': pk, 'amount': 1} for pk in ids[:size]
+                        ],
+                    }
+                    with CaptureQueriesContext(connection) as context:
+                        start = time.perf_counter()
+                        response = client.post(
+                            '/api/recipes/', data, format='json'
+                        )
+                        timings.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 201:
+                        self.stderr.write(f'{size}: {response.data}')
+                        continue
+                    created.append(response.data['id'])
+                    queries.add(len(context.captured_queries))
+                self.stdout.write(
+                    f'ингредиентов {size:>4}: '
+                    f'запросов {"/".join(map(str, sorted(queries)))}, '
+                    f'p50={statistics.median(timings):.1f} мс '
+                    f'max={max(timings):.1f} мс'
+                )
+            for recipe in Recipe.objects.filter(id__in=created):
+                recipe.image.delete(save=False)
+            transaction.set_rollback(True)
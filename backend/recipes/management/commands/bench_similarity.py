@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from recipes.similarity import Neighbours, to_matrix
+
+
+def synthetic_pairs(recipes, ingredients, per_recipe, seed):
+    """Составы с популярностью ингредиентов по закону Ципфа: соль и
+    масло встречаются в трети рецептов, редкие – в единицах."""
+    generator = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, ingredients + 1)
+    weights /= weights.sum()
+    pairs = []
+    for recipe in range(1, recipes + 1):
+        count = generator.integers(per_recipe // 2, per_recipe * 3 // 2 + 1)
+        for ingredient in np.unique(
+            generator.choice(ingredients, size=count, p=weights)
+        ):
+            pairs.append((recipe, ingredient + 1))
+    return pairs
+
+
+class Command(BaseCommand):
+    help = ('Замер полного расчёта похожих рецептов на синтетических '
+            'данных без БД. Запуск: '
+            'python manage.py bench_similarity --recipes 100000')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100_000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument(
+            '--limit', type=int, default=settings.SIMILAR_RECIPES_LIMIT
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        pairs = synthetic_pairs(
+            options['recipes'],
+            options['ingredients'],
+            options['per_recipe'],
+            options['seed'],
+        )
+        self.stdout.write(
+            f'{len(pairs)} строк состава сгенерировано за '
+            f'{time.perf_counter() - start:.1f} сек.'
+        )
+        start = time.perf_counter()
+        ids, matrix = to_matrix(pairs)
+        neighbours = Neighbours(ids, matrix)
+        self.stdout.write(
+            f'Матрица {matrix.shape[0]}×{matrix.shape[1]} построена за '
+            f'{time.perf_counter() - start:.2f} сек.'
+        )
+        start = time.perf_counter()
+        found = sum(
+            len(similar) for _, similar in
+            neighbours.top(range(len(ids)), options['limit'])
+        )
+        seconds = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Топ-{options["limit"]} соседей для {len(ids)} рецептов '
+            f'({found} пар) за {seconds:.1f} сек., '
+            f'{seconds / len(ids) * 1000:.2f} мс на рецепт.'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from recipes.models import Recipe
+from recipes.tasks import build_image_variants
+
+
+class Command(BaseCommand):
+    help = ('Создание уменьшенных копий изображений рецептов. Запуск: '
+            'python manage.py build_image_variants')
+
+    def handle(self, *args, **kwargs):
+        created = 0
+        ids = Recipe.objects.values_list('id', flat=True)
+        for recipe_id in ids.iterator():
+            try:
+                created += build_image_variants(recipe_id)
+            except (OSError, ValueError) as error:
+                self.stdout.write(self.style.WARNING(
+                    f'Рецепт {recipe_id}: {error}.'
+                ))
+        self.stdout.write(self.style.SUCCESS(f'Создано копий: {created}.'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.similarity import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Полный пересчёт похожих рецептов по составу. Запуск: '
+            'python manage.py build_similar_recipes [--limit 10]')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        recipes = rebuild(options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты для {recipes} рецептов посчитаны за '
+            f'{time.perf_counter() - start:.1f} сек.'
+        ))
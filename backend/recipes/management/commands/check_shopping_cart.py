@@ -0,0 +1,40 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.shopping_cart import find_drift, rebuild
+from recipes.tasks import fix_shopping_carts
+
+
+class Command(BaseCommand):
+    help = ('Сверка сумм списков покупок с рецептами в корзинах. Запуск: '
+            'python manage.py check_shopping_cart [--fix | --queue]')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Пересобрать суммы у пользователей с расхождениями.',
+        )
+        parser.add_argument(
+            '--queue',
+            action='store_true',
+            help='Поставить сверку с пересборкой в очередь задач.',
+        )
+
+    def handle(self, *args, **options):
+        if options['queue']:
+            job = fix_shopping_carts.enqueue(key='fix-shopping-carts')
+            self.stdout.write(f'Сверка – задача #{job.id}.')
+            return
+        users = find_drift()
+        if not users:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        self.stdout.write(self.style.WARNING(
+            f'Расхождения у пользователей: '
+            f'{", ".join(map(str, sorted(users)))}.'
+        ))
+        if options['fix']:
+            with transaction.atomic():
+                rebuild(users)
+            self.stdout.write(self.style.SUCCESS('Суммы пересобраны.'))
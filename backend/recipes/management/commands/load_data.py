@@ -1,34 +1,101 @@
-import datetime
+import csv
 import json
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import DatabaseError
 
 from recipes.models import Ingredient
+from recipes.signals import bulk_loaded
 
 FILE: str = f'{settings.BASE_DIR}/data/ingredients.json'
+READ_SIZE = 64 * 1024
 
 
-def import_json_data():
-    with open(FILE, 'r', encoding='utf-8') as file:
-        data = json.load(file)
-        for note in data:
-            Ingredient.objects.get_or_create(**note)
+def iter_json(file):
+    """Объекты верхнеуровневого JSON-массива без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('ожидался JSON-массив')
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if buffer.startswith(']', position):
+            return
+        try:
+            note, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield note
+
+
+def iter_csv(file):
+    for name, measurement_unit in csv.reader(file):
+        yield {'name': name, 'measurement_unit': measurement_unit}
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
 class Command(BaseCommand):
+    help = ('Загрузка ингредиентов из JSON или CSV пакетами, повторный '
+            'запуск не создаёт дублей. Запуск: python manage.py load_data '
+            '[--file data/ingredients.csv] [--batch-size 5000] '
+            '[--offset N] [--dry-run]')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=FILE)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--offset',
+            type=int,
+            default=0,
+            help='Пропустить первые N строк, чтобы продолжить загрузку.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Прочитать и проверить файл без записи в базу.',
+        )
 
     def handle(self, *args, **options):
-        start_time = datetime.datetime.now()
+        path = options['file']
+        reader = iter_csv if path.endswith('.csv') else iter_json
+        start_time = time.perf_counter()
+        rows = options['offset']
         try:
-            import_json_data()
-        except Exception as error:
-            self.stdout.write(
-                self.style.WARNING(f'Сбой в работе импорта: {error}.')
-            )
-        else:
-            self.stdout.write(self.style.SUCCESS(
-                f'Загрузка данных завершена за '
-                f' {(datetime.datetime.now() - start_time).total_seconds()} '
-                f'сек.')
+            with open(path, 'r', encoding='utf-8') as file:
+                notes = islice(reader(file), options['offset'], None)
+                for batch in batches(notes, options['batch_size']):
+                    if not options['dry_run']:
+                        Ingredient.objects.bulk_create(
+                            (Ingredient(**note) for note in batch),
+                            ignore_conflicts=True,
+                        )
+                    rows += len(batch)
+                    self.stdout.write(f'Обработано строк: {rows}')
+        except (OSError, ValueError, TypeError, DatabaseError) as error:
+            raise CommandError(
+                f'Сбой в работе импорта на строке {rows}: {error}. '
+                f'Продолжить можно с --offset {rows}.'
             )
+        finally:
+            if rows > options['offset'] and not options['dry_run']:
+                bulk_loaded.send(sender=Ingredient)
+        seconds = time.perf_counter() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f'Загрузка данных завершена за {seconds:.2f} сек., '
+            f'{(rows - options["offset"]) / seconds:.0f} строк/сек.'
+        ))
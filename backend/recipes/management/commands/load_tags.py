@@ -1,6 +1,7 @@
 from django.core.management import BaseCommand
 
 from recipes.models import Tag
+from recipes.signals import bulk_loaded
 
 
 class Command(BaseCommand):
@@ -13,11 +14,10 @@ class Command(BaseCommand):
             ('Обед', '#008000', 'lunch'),
             ('Ужин', '#7366BD', 'dinner'),
         )
-        for tag in tags:
-            name, color, slug = tag
-            Tag.objects.get_or_create(
-                name=name,
-                color=color,
-                slug=slug
-            )
+        Tag.objects.bulk_create(
+            (Tag(name=name, color=color, slug=slug)
+             for name, color, slug in tags),
+            ignore_conflicts=True,
+        )
+        bulk_loaded.send(sender=Tag)
         self.stdout.write(self.style.SUCCESS('Тэги добавлены.'))
@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount
+from recipes.tasks import recount_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт счётчиков избранного, списков покупок, '
+            'рецептов и подписчиков. Запуск: python manage.py recount '
+            '[--queue]')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue',
+            action='store_true',
+            help='Поставить пересчёт в очередь задач вместо запуска здесь.',
+        )
+
+    def handle(self, *args, **options):
+        if options['queue']:
+            job = recount_counters.enqueue(key='recount-counters')
+            self.stdout.write(f'Пересчёт – задача #{job.id}.')
+            return
+        with transaction.atomic():
+            drift = recount()
+        for counter, rows in drift.items():
+            self.stdout.write(f'{counter}: исправлено строк – {rows}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
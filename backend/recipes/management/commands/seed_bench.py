@@ -0,0 +1,315 @@
+import time
+from datetime import timedelta
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from recipes import trending
+from recipes.counters import recount
+from recipes.images import build_variants
+from recipes.models import (
+    FeedItem,
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+)
+from recipes.shopping_cart import rebuild
+from recipes.signals import bulk_loaded
+from users.models import Follow
+
+User = get_user_model()
+
+EMAIL_DOMAIN = 'seed.bench.local'
+PASSWORD = 'bench-password'
+IMAGE_NAME = 'recipe_images/seed-bench.png'
+
+
+@lru_cache()
+def zipf_weights(count, exponent):
+    weights = 1 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def zipf(generator, count, size, exponent=1.0):
+    """size номеров из range(count), популярность номера k ~ 1/k^s."""
+    return generator.choice(count, size=size, p=zipf_weights(count, exponent))
+
+
+def distinct_zipf(generator, count, size, exclude=None):
+    """Не более size разных номеров с ципфовской популярностью."""
+    size = min(size, count - (exclude is not None))
+    chosen = set()
+    while len(chosen) < size:
+        chosen.update(zipf(generator, count, 2 * (size - len(chosen))))
+        chosen.discard(exclude)
+    return list(chosen)[:size]
+
+
+def spread_dates(generator, count, days, now):
+    """Случайные моменты за последние days дней по возрастанию."""
+    seconds = np.sort(generator.uniform(0, days * 86400, count))[::-1]
+    return [now - timedelta(seconds=float(value)) for value in seconds]
+
+
+def ensure_image():
+    if not default_storage.exists(IMAGE_NAME):
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), (200, 120, 40)).save(buffer, 'PNG')
+        default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+    image = Recipe(image=IMAGE_NAME).image
+    _, widths = build_variants(image)
+    return {'name': IMAGE_NAME, 'widths': widths}
+
+
+def ensure_rows(model, count, make):
+    ids = list(model.objects.values_list('id', flat=True)[:count])
+    if len(ids) < count:
+        model.objects.bulk_create(
+            make(number) for number in range(len(ids), count)
+        )
+        ids = list(model.objects.values_list('id', flat=True)[:count])
+    return ids
+
+
+class Command(BaseCommand):
+    help = ('Синтетические данные для нагрузочных замеров: пользователи, '
+            'подписки, рецепты с ципфовским составом и тегами, избранное '
+            'и списки покупок. Запуск: python manage.py seed_bench '
+            '[--users 1000] [--recipes 10000] [--clear]')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10_000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--follows', type=int, default=20)
+        parser.add_argument('--favorites', type=int, default=30)
+        parser.add_argument('--carts', type=int, default=5)
+        parser.add_argument(
+            '--days', type=int, default=90,
+            help='За сколько дней разнесены даты публикаций и добавлений.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить ранее созданные данные и выйти.',
+        )
+
+    def step(self, message, start):
+        self.stdout.write(
+            f'{message} за {time.perf_counter() - start:.1f} сек.'
+        )
+        return time.perf_counter()
+
+    def handle(self, *args, **options):
+        seeded = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}')
+        if options['clear']:
+            deleted = seeded.delete()[1].get(User._meta.label, 0)
+            bulk_loaded.send(sender=Recipe)
+            bulk_loaded.send(sender=Follow)
+            self.stdout.write(self.style.SUCCESS(
+                f'Удалено пользователей: {deleted}.'
+            ))
+            return
+        if seeded.exists():
+            self.stderr.write('Данные уже созданы, сначала --clear.')
+            return
+        generator = np.random.default_rng(options['seed'])
+        batch_size = options['batch_size']
+        now = timezone.now()
+        start = time.perf_counter()
+        with transaction.atomic():
+            variants = ensure_image()
+            ingredients = ensure_rows(
+                Ingredient, options['ingredients'],
+                lambda number: Ingredient(
+                    name=f'Ингредиент seed-{number}', measurement_unit='г'
+                ),
+            )
+            tags = ensure_rows(
+                Tag, 3,
+                lambda number: Tag(
+                    name=f'Тег {number}', slug=f'seed-{number}',
+                    color=f'#{number:06x}',
+                ),
+            )
+            password = make_password(PASSWORD)
+            User.objects.bulk_create(
+                (
+                    User(
+                        email=f'seed-{number}@{EMAIL_DOMAIN}',
+                        username=f'seed-{number}',
+                        first_name='Seed',
+                        last_name=str(number),
+                        password=password,
+                    )
+                    for number in range(options['users'])
+                ),
+                batch_size=batch_size,
+            )
+            users = list(seeded.order_by('id').values_list('id', flat=True))
+            start = self.step(f'Пользователей: {len(users)}', start)
+
+            authors = [
+                users[number] for number in
+                zipf(generator, len(users), options['recipes'])
+            ]
+            Recipe.objects.bulk_create(
+                (
+                    Recipe(
+                        name=f'Рецепт {number}',
+                        text=f'Описание рецепта {number}',
+                        author_id=author,
+                        image=IMAGE_NAME,
+                        image_variants=variants,
+                        cooking_time=int(generator.integers(5, 180)),
+                    )
+                    for number, author in enumerate(authors)
+                ),
+                batch_size=batch_size,
+            )
+            recipes = list(Recipe.objects.filter(
+                author__in=users
+            ).order_by('id'))
+            # pub_date и created_at выставляет auto_now_add,
+            # настоящие даты – вторым проходом.
+            for recipe, pub_date in zip(recipes, spread_dates(
+                generator, len(recipes), options['days'], now
+            )):
+                recipe.pub_date = pub_date
+            Recipe.objects.bulk_update(
+                recipes, ('pub_date',), batch_size=1000
+            )
+            start = self.step(f'Рецептов: {len(recipes)}', start)
+
+            RecipeIngredient.objects.bulk_create(
+                (
+                    RecipeIngredient(
+                        recipe_id=recipe.id,
+                        ingredient_id=ingredients[number],
+                        amount=int(generator.integers(1, 500)),
+                    )
+                    for recipe in recipes
+                    for number in distinct_zipf(
+                        generator, len(ingredients), int(generator.integers(
+                            options['per_recipe'] // 2,
+                            options['per_recipe'] * 3 // 2 + 1,
+                        )),
+                    )
+                ),
+                batch_size=batch_size,
+            )
+            Recipe.tags.through.objects.bulk_create(
+                (
+                    Recipe.tags.through(
+                        recipe_id=recipe.id, tag_id=tags[number]
+                    )
+                    for recipe in recipes
+                    for number in distinct_zipf(
+                        generator, len(tags), int(generator.integers(1, 4))
+                    )
+                ),
+                batch_size=batch_size,
+            )
+            start = self.step('Состав и теги', start)
+
+            follows = [
+                (user, users[number])
+                for position, user in enumerate(users)
+                for number in distinct_zipf(
+                    generator, len(users), options['follows'],
+                    exclude=position,
+                )
+            ]
+            Follow.objects.bulk_create(
+                (
+                    Follow(follower_id=follower, following_id=author)
+                    for follower, author in follows
+                ),
+                batch_size=batch_size,
+            )
+            start = self.step(f'Подписок: {len(follows)}', start)
+
+            # Популярность рецептов не связана с их id.
+            popular = generator.permutation(len(recipes))
+            pub_dates = {recipe.id: recipe.pub_date for recipe in recipes}
+            for model, per_user in (
+                (Favorite, options['favorites']),
+                (ShoppingCart, options['carts']),
+            ):
+                rows = [
+                    model(user_id=user, recipe_id=recipes[popular[number]].id)
+                    for user in users
+                    for number in distinct_zipf(
+                        generator, len(recipes), per_user
+                    )
+                ]
+                model.objects.bulk_create(rows, batch_size=batch_size)
+                rows = list(model.objects.filter(user__in=users))
+                for row, created_at in zip(rows, spread_dates(
+                    generator, len(rows), options['days'], now
+                )):
+                    row.created_at = max(created_at, pub_dates[row.recipe_id])
+                model.objects.bulk_update(
+                    rows, ('created_at',), batch_size=1000
+                )
+                start = self.step(
+                    f'{model._meta.verbose_name_plural}: {len(rows)}', start
+                )
+
+            feed = self.fill_derived(users, recipes, follows)
+            start = self.step(
+                f'Счётчики, списки покупок, записей лент: {feed}', start
+            )
+        for model in (Recipe, RecipeIngredient, Favorite, ShoppingCart,
+                      Follow):
+            bulk_loaded.send(sender=model)
+        trending.update()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Пароль пользователей seed-N@{EMAIL_DOMAIN}: '
+            f'{PASSWORD}. Похожие рецепты: '
+            f'python manage.py build_similar_recipes'
+        ))
+
+    def fill_derived(self, users, recipes, follows):
+        """То, что при обычной записи делают сигналы и задачи."""
+        recount()
+        rebuild(users)
+        Recipe.objects.filter(author__in=users).update_search_vector()
+        followers = {}
+        for _, author in follows:
+            followers[author] = followers.get(author, 0) + 1
+        latest = {}
+        for recipe in reversed(recipes):
+            by_author = latest.setdefault(recipe.author_id, [])
+            if len(by_author) < settings.FEED_BACKFILL_LIMIT:
+                by_author.append(recipe)
+        return len(FeedItem.objects.bulk_create(
+            (
+                FeedItem(
+                    user_id=follower,
+                    recipe_id=recipe.id,
+                    author_id=author,
+                    pub_date=recipe.pub_date,
+                )
+                for follower, author in follows
+                if followers[author] <= settings.FEED_FANOUT_LIMIT
+                for recipe in latest.get(author, ())
+            ),
+            batch_size=5000,
+        ))
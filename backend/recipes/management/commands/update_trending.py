@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+
+from recipes import trending
+from recipes.tasks import schedule_trending_update
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт популярности рецептов за последнее время. Запуск: '
+            'python manage.py update_trending [--schedule]')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--schedule',
+            action='store_true',
+            help='Поставить периодический пересчёт в очередь задач.',
+        )
+
+    def handle(self, *args, **options):
+        changed = trending.update()
+        self.stdout.write(self.style.SUCCESS(
+            f'Изменена популярность рецептов: {changed}.'
+        ))
+        if options['schedule']:
+            job = schedule_trending_update()
+            self.stdout.write(
+                f'Следующий пересчёт – задача #{job.id}, {job.run_at:%H:%M}.'
+            )
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.23 on 2026-10-18 05:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'Favorite', 'recipe'),
+    ('recipes', 'Recipe', 'shopping_cart_count',
+     'recipes', 'ShoppingCart', 'recipe'),
+    ('users', 'User', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    ('users', 'User', 'followers_count', 'users', 'Follow', 'following'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model, field, source_app, source, fk in COUNTERS:
+        source = apps.get_model(source_app, source)
+        apps.get_model(app, model).objects.update(**{
+            field: Coalesce(
+                Subquery(
+                    source.objects.filter(**{fk: OuterRef('pk')})
+                    .order_by()
+                    .values(fk)
+                    .annotate(total=Count('pk'))
+                    .values('total')
+                ),
+                0,
+            )
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_search_vector'),
+        ('users', '0005_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.2.23 on 2026-10-18 05:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Значения settings на момент написания миграции.
+FEED_FANOUT_LIMIT = 1000
+FEED_BACKFILL_LIMIT = 100
+
+
+def fill_feeds(apps, schema_editor):
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Follow = apps.get_model('users', 'Follow')
+    follows = Follow.objects.filter(
+        following__followers_count__lte=FEED_FANOUT_LIMIT
+    ).values_list('follower_id', 'following_id')
+    for follower, author in follows.iterator():
+        FeedItem.objects.bulk_create(
+            FeedItem(
+                user_id=follower,
+                recipe_id=recipe,
+                author_id=author,
+                pub_date=pub_date,
+            )
+            for recipe, pub_date in Recipe.objects.filter(
+                author=author
+            ).order_by('-pub_date', '-id').values_list(
+                'id', 'pub_date'
+            )[:FEED_BACKFILL_LIMIT]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_recipe_pub_date_id_idx'),
+        ('users', '0005_user_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', 'author'], name='feed_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_item'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
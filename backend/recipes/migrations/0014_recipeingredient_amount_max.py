@@ -0,0 +1,22 @@
+# Generated by Django 3.2.23 on 2026-10-18 06:45
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_image_variants'),
+    ]
+
+    # MAX_AMOUNT подняли до 1000 без миграции, 0001 хранит старый
+    # предел 100. Валидаторы живут только в Python: схема не меняется,
+    # миграция лишь выравнивает состояние, чтобы makemigrations молчал.
+    operations = [
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='amount',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1, message='Выберите индигриент'), django.core.validators.MaxValueValidator(1000, message='Блюдо содержит больше 1000 индигриентов')], verbose_name='Количество'),
+        ),
+    ]
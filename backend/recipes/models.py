@@ -1,9 +1,17 @@
 from colorfield.fields import ColorField
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField,
+)
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from django.db.models.expressions import Exists, OuterRef
+from django.db import connection, models
+from django.db.models.expressions import Exists, F, OuterRef, RawSQL
+
+from users.models import DenormalizedFieldsMixin
 
 User = get_user_model()
 
@@ -61,18 +69,73 @@ class Ingredient(models.Model):
 
 
 class RecipeQuerySet(models.QuerySet):
+
+    def with_reference(self):
+        """Рецепты с составом и id тэгов для сериализации: названия
+        тэгов и ингредиентов берутся из справочников в памяти."""
+        return self.prefetch_related(
+            'recipes',
+            models.Prefetch('tags', queryset=Tag.objects.only('id')),
+        )
+
     def user_annotation(self, user):
         return self.annotate(
             is_favorited=Exists(
                 Favorite.objects.filter(user=user, recipe=OuterRef('id'))),
             is_in_shopping_cart=Exists(
                 ShoppingCart.objects.filter(user=user, recipe=OuterRef('id')))
-        ).select_related('author').prefetch_related(
-            'recipes__ingredient', 'tags'
+        ).select_related('author').with_reference()
+
+    def latest_per_author(self, authors, limit):
+        """Не более limit последних рецептов каждого из авторов."""
+        if not authors:
+            return self.none()
+        placeholders = ', '.join(['%s'] * len(authors))
+        return self.filter(id__in=RawSQL(
+            f'SELECT id FROM ('
+            f'SELECT id, ROW_NUMBER() OVER ('
+            f'PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+            f') AS position FROM {self.model._meta.db_table} '
+            f'WHERE author_id IN ({placeholders})'
+            f') AS ranked WHERE position <= %s',
+            (*authors, limit),
+        ))
+
+    def search(self, value):
+        if connection.vendor != 'postgresql':
+            return self.filter(
+                models.Q(name__icontains=value)
+                | models.Q(text__icontains=value)
+            )
+        query = SearchQuery(
+            value, config=settings.SEARCH_CONFIG, search_type='websearch'
+        )
+        return self.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date')
+
+    def update_search_vector(self):
+        if connection.vendor != 'postgresql':
+            return 0
+        return self.update(
+            search_vector=(
+                SearchVector(
+                    'name', weight='A', config=settings.SEARCH_CONFIG
+                )
+                + SearchVector(
+                    'text', weight='B', config=settings.SEARCH_CONFIG
+                )
+            )
         )
 
 
-class Recipe(models.Model):
+class Recipe(DenormalizedFieldsMixin, models.Model):
+    denormalized_fields = (
+        'favorites_count',
+        'shopping_cart_count',
+        'trending_score',
+        'image_variants',
+    )
 
     name = models.CharField(
         verbose_name='Название рецепта',
@@ -103,6 +166,13 @@ class Recipe(models.Model):
         verbose_name='Изображение рецепта',
         upload_to='recipe_images/',
     )
+    # {'name': имя оригинала, 'widths': [...]}: копии, которые уже
+    # созданы. Пишет только задача build_image_variants.
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        editable=False,
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления',
         validators=[
@@ -121,12 +191,47 @@ class Recipe(models.Model):
         auto_now_add=True,
         editable=False,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False,
+    )
+    trending_score = models.FloatField(
+        verbose_name='Популярность за последнее время',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
     objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('-trending_score', '-id'),
+                name='recipe_trending_idx',
+            ),
+        )
         constraints = (
             models.UniqueConstraint(
                 fields=['name', 'author'],
@@ -193,6 +298,11 @@ class UserRelatedModel(models.Model):
         Recipe,
         on_delete=models.CASCADE,
     )
+    created_at = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         abstract = True
@@ -219,3 +329,127 @@ class ShoppingCart(UserRelatedModel):
     class Meta(UserRelatedModel.Meta):
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
+
+
+class ShoppingCartIngredient(models.Model):
+    """Сумма ингредиента по всем рецептам в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_cart_ingredients',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_cart_ingredients',
+    )
+    total = models.IntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_ingredient',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total}'
+
+
+class FeedItem(models.Model):
+    """Запись ленты подписок: рецепт автора, на которого подписан
+    пользователь. Заполняется при публикации рецепта."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='feed_items',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='feed_items',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_user_author_idx',
+            ),
+        )
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
+class RecipeSimilarity(models.Model):
+    """Ближайший по составу рецепт: коэффициент Жаккара множеств
+    ингредиентов. Для каждого рецепта хранится не более
+    SIMILAR_RECIPES_LIMIT соседей."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='similar_recipes',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт',
+        related_name='similar_to',
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'),
+                name='similarity_recipe_score_idx',
+            ),
+        )
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_recipe_similarity',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}: {self.score:.2f}'
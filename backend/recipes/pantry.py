@@ -0,0 +1,228 @@
+import time
+from collections import namedtuple
+from datetime import timedelta
+from threading import Lock
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from recipes.models import Recipe, RecipeIngredient
+from recipes.versions import get_version
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+# Состояние индекса целиком: update() собирает новое и подменяет его
+# одним присваиванием, поэтому match() не видит половину изменений.
+State = namedtuple('State', ('ingredients', 'tags', 'recipes', 'sizes'))
+
+
+def postings(pairs):
+    """Пары (рецепт, ключ) в словарь ключ → отсортированный массив id
+    рецептов."""
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    pairs = pairs[np.lexsort((pairs[:, 0], pairs[:, 1]))]
+    keys, starts = np.unique(pairs[:, 1], return_index=True)
+    return {
+        int(key): recipes
+        for key, recipes in zip(keys, np.split(pairs[:, 0], starts[1:]))
+    }
+
+
+def insert(array, values):
+    return np.union1d(array, np.asarray(values, dtype=np.int64))
+
+
+def remove(array, values):
+    return np.setdiff1d(array, np.asarray(values, dtype=np.int64),
+                        assume_unique=True)
+
+
+class PantryIndex:
+    """Обратный индекс состава рецептов в памяти процесса.
+
+    Для каждого ингредиента и тега хранится отсортированный массив id
+    рецептов, для каждого рецепта – его ингредиенты. При смене версии
+    'compositions' перечитываются только рецепты, изменённые с прошлой
+    сверки (с запасом PANTRY_SYNC_MARGIN на долгие транзакции), а
+    удалённые находятся по расхождению числа рецептов. Строки состава,
+    удалённые без сохранения рецепта (каскадом вместе с ингредиентом,
+    в админке), выдаёт расхождение числа строк: индекс строится заново.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.version = None
+        self.checked_at = 0
+        self.synced_at = None
+        self.state = State({}, {}, {}, np.zeros(0, dtype=np.int32))
+
+    def refresh(self):
+        now = time.monotonic()
+        if (
+            self.version is not None
+            and now - self.checked_at < settings.REFERENCE_CHECK_INTERVAL
+        ):
+            return
+        with self.lock:
+            version = get_version('compositions')
+            self.checked_at = now
+            if version == self.version:
+                return
+            if self.version is None:
+                self.build()
+            else:
+                self.update()
+            self.version = version
+
+    def build(self):
+        synced_at = timezone.now()
+        pairs = self.load(RecipeIngredient.objects.all())
+        tags = self.load(Recipe.tags.through.objects.all(), 'tag_id')
+        recipes = {}
+        for recipe, ingredient in pairs.tolist():
+            recipes.setdefault(recipe, set()).add(ingredient)
+        for recipe in Recipe.objects.order_by().values_list(
+            'id', flat=True
+        ).iterator():
+            recipes.setdefault(recipe, set())
+        recipes = {
+            recipe: frozenset(ingredients)
+            for recipe, ingredients in recipes.items()
+        }
+        sizes = np.zeros(max(recipes, default=0) + 1, np.int32)
+        for recipe, ingredients in recipes.items():
+            sizes[recipe] = len(ingredients)
+        self.state = State(postings(pairs), postings(tags), recipes, sizes)
+        self.synced_at = synced_at
+
+    def update(self):
+        synced_at = timezone.now()
+        state = self.state
+        changed = list(Recipe.objects.filter(
+            updated_at__gte=self.synced_at - timedelta(
+                seconds=settings.PANTRY_SYNC_MARGIN
+            )
+        ).order_by().values_list('id', flat=True))
+        deleted = set()
+        if Recipe.objects.count() != len(state.recipes.keys() | {*changed}):
+            deleted = state.recipes.keys() - set(
+                Recipe.objects.order_by().values_list(
+                    'id', flat=True
+                ).iterator()
+            )
+        ingredients = {recipe: set() for recipe in changed}
+        for recipe, ingredient in self.load(
+            RecipeIngredient.objects.filter(recipe__in=changed)
+        ).tolist():
+            ingredients[recipe].add(ingredient)
+        tags = {recipe: set() for recipe in changed}
+        for recipe, tag in self.load(
+            Recipe.tags.through.objects.filter(recipe__in=changed), 'tag_id'
+        ).tolist():
+            tags[recipe].add(tag)
+        for recipe in deleted:
+            ingredients[recipe] = set()
+            tags[recipe] = set()
+        known = [recipe for recipe in ingredients if recipe in state.recipes]
+        if RecipeIngredient.objects.count() != (
+            int(state.sizes.sum()) - int(state.sizes[known].sum())
+            + sum(map(len, ingredients.values()))
+        ):
+            self.build()
+            return
+        index = dict(state.ingredients)
+        self.apply(index, ingredients, state.recipes)
+        tag_index = dict(state.tags)
+        self.apply(tag_index, tags, self.recipe_tags(tag_index, tags))
+        recipes = dict(state.recipes)
+        sizes = state.sizes.copy()
+        if max(ingredients, default=0) >= len(sizes):
+            sizes = np.resize(sizes, max(ingredients) + 1)
+        for recipe, values in ingredients.items():
+            if recipe in deleted:
+                recipes.pop(recipe, None)
+            else:
+                recipes[recipe] = frozenset(values)
+            sizes[recipe] = len(values)
+        self.state = State(index, tag_index, recipes, sizes)
+        self.synced_at = synced_at
+
+    @staticmethod
+    def recipe_tags(index, recipes):
+        """Текущие теги рецептов по индексу тегов."""
+        result = {recipe: set() for recipe in recipes}
+        keys = np.fromiter(recipes, dtype=np.int64, count=len(recipes))
+        for tag, array in index.items():
+            for recipe in keys[np.isin(keys, array)].tolist():
+                result[recipe].add(tag)
+        return result
+
+    @staticmethod
+    def apply(index, new, old):
+        """Переносит рецепты между массивами индекса по разнице
+        старых и новых ключей."""
+        added, removed = {}, {}
+        for recipe, keys in new.items():
+            previous = old.get(recipe, frozenset())
+            for key in keys - previous:
+                added.setdefault(key, []).append(recipe)
+            for key in previous - keys:
+                removed.setdefault(key, []).append(recipe)
+        for key, recipes in removed.items():
+            index[key] = remove(index.get(key, EMPTY), recipes)
+        for key, recipes in added.items():
+            index[key] = insert(index.get(key, EMPTY), recipes)
+
+    @staticmethod
+    def load(queryset, field='ingredient_id'):
+        pairs = queryset.order_by().values_list('recipe_id', field)
+        return np.fromiter(
+            (value for pair in pairs.iterator(chunk_size=10000)
+             for value in pair),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+
+    def match(self, ingredient_ids, tag_ids=None, limit=None):
+        """Рецепты, где есть хоть один из ингредиентов, по убыванию
+        покрытия: [(id, есть, всего), ...]. tag_ids – хотя бы один из
+        тегов, None – без фильтра.
+
+        При равном покрытии выше рецепты, где докупать меньше.
+        """
+        self.refresh()
+        state = self.state
+        limit = limit or settings.PANTRY_MATCH_LIMIT
+        arrays = [
+            state.ingredients[pk] for pk in set(ingredient_ids)
+            if pk in state.ingredients
+        ]
+        if not arrays:
+            return []
+        recipes, have = np.unique(np.concatenate(arrays), return_counts=True)
+        if tag_ids is not None:
+            tagged = [
+                state.tags[pk] for pk in set(tag_ids) if pk in state.tags
+            ]
+            keep = np.isin(recipes, np.concatenate(tagged or [EMPTY]))
+            recipes, have = recipes[keep], have[keep]
+        total = state.sizes[recipes]
+        coverage = have / total
+        if len(recipes) > limit:
+            bound = np.partition(coverage, len(coverage) - limit)[-limit]
+            keep = coverage >= bound
+            recipes, have, total = recipes[keep], have[keep], total[keep]
+            coverage = coverage[keep]
+        order = np.lexsort((-recipes, total - have, -coverage))[:limit]
+        return list(zip(
+            recipes[order].tolist(), have[order].tolist(),
+            total[order].tolist(),
+        ))
+
+    def missing(self, recipe_id, ingredient_ids):
+        return self.state.recipes.get(recipe_id, frozenset()) - set(
+            ingredient_ids
+        )
+
+
+index = PantryIndex()
@@ -0,0 +1,90 @@
+import time
+from collections import namedtuple
+from threading import Lock
+
+from django.apps import apps
+from django.conf import settings
+
+from recipes.versions import get_version
+
+TagRow = namedtuple('TagRow', ('id', 'name', 'color', 'slug'))
+IngredientRow = namedtuple(
+    'IngredientRow', ('id', 'name', 'measurement_unit')
+)
+
+
+class ReferenceTable:
+    """Копия редко меняющегося справочника в памяти процесса.
+
+    Строки – неизменяемые namedtuple в порядке сортировки модели.
+    Актуальность сверяется с общей версией данных из кеша не чаще
+    раза в REFERENCE_CHECK_INTERVAL секунд, так что правки из админки
+    доходят до всех процессов в пределах этого интервала.
+    """
+
+    def __init__(self, model, version_name, row_class):
+        self.model = model
+        self.version_name = version_name
+        self.row_class = row_class
+        self.lock = Lock()
+        self.version = None
+        self.checked_at = 0
+        self.rows = ()
+        self.indexes = {}
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if (
+            not force and self.version is not None
+            and now - self.checked_at < settings.REFERENCE_CHECK_INTERVAL
+        ):
+            return
+        with self.lock:
+            version = get_version(self.version_name)
+            self.checked_at = now
+            if version == self.version:
+                return
+            model = apps.get_model('recipes', self.model)
+            rows = tuple(
+                self.row_class(*values)
+                for values in model.objects.values_list(
+                    *self.row_class._fields
+                ).iterator()
+            )
+            self.indexes = {'id': {row.id: row for row in rows}}
+            self.rows = rows
+            self.version = version
+
+    def invalidate(self):
+        """Перечитать справочник при следующем обращении."""
+        with self.lock:
+            self.version = None
+
+    def all(self):
+        self.refresh()
+        return self.rows
+
+    def index(self, field):
+        self.refresh()
+        indexes = self.indexes
+        if field not in indexes:
+            indexes[field] = {
+                getattr(row, field): row for row in indexes['id'].values()
+            }
+        return indexes[field]
+
+    def get(self, value, field='id'):
+        return self.in_bulk([value], field).get(value)
+
+    def in_bulk(self, values, field='id'):
+        """Строки по значениям поля. Если чего-то нет, версия сверяется
+        сразу – строку могли добавить только что."""
+        index = self.index(field)
+        if any(value not in index for value in values):
+            self.refresh(force=True)
+            index = self.index(field)
+        return {value: index[value] for value in values if value in index}
+
+
+tags = ReferenceTable('Tag', 'tags', TagRow)
+ingredients = ReferenceTable('Ingredient', 'ingredients', IngredientRow)
@@ -0,0 +1,119 @@
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Sum
+
+from recipes.models import (
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartIngredient,
+)
+
+
+def recipe_amounts(recipe_ids):
+    amounts = Counter()
+    for ingredient, amount in RecipeIngredient.objects.filter(
+        recipe__in=recipe_ids
+    ).values_list('ingredient_id', 'amount'):
+        amounts[ingredient] += amount
+    return amounts
+
+
+def apply_delta(user_ids, delta):
+    """Прибавляет delta {ingredient_id: количество} к спискам покупок
+    пользователей; строки с нулевым остатком удаляются – остаток может
+    дойти до нуля, только если что-то вычиталось."""
+    rows = [
+        (user, ingredient, amount)
+        for user in user_ids
+        for ingredient, amount in delta.items()
+        if amount
+    ]
+    if not rows:
+        return
+    table = ShoppingCartIngredient._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (user_id, ingredient_id, total) '
+            f'VALUES (%s, %s, %s) '
+            f'ON CONFLICT (user_id, ingredient_id) '
+            f'DO UPDATE SET total = {table}.total + EXCLUDED.total',
+            rows,
+        )
+    if any(amount < 0 for _, _, amount in rows):
+        ShoppingCartIngredient.objects.filter(
+            user__in=user_ids, total__lte=0
+        ).delete()
+
+
+def add_recipes(user_id, recipe_ids):
+    apply_delta([user_id], recipe_amounts(recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    delta = Counter()
+    delta.subtract(recipe_amounts(recipe_ids))
+    apply_delta([user_id], delta)
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    delta = Counter(new_amounts)
+    delta.subtract(old_amounts)
+    apply_delta(
+        list(ShoppingCart.objects.filter(
+            recipe=recipe_id
+        ).values_list('user_id', flat=True)),
+        delta,
+    )
+
+
+@contextmanager
+def changing_recipes(recipe_ids):
+    """Состав рецептов recipe_ids меняется внутри блока построчными
+    правками, например в админке: по выходе разница применяется к
+    спискам покупок."""
+    old = {recipe: recipe_amounts([recipe]) for recipe in recipe_ids}
+    yield
+    for recipe, amounts in old.items():
+        change_recipe(recipe, amounts, recipe_amounts([recipe]))
+
+
+def expected_totals(user_ids=None):
+    # Одно условие на список покупок: второй filter() по той же
+    # многозначной связи добавил бы ещё одно соединение.
+    condition = {'recipe__shoppingcart__isnull': False}
+    if user_ids is not None:
+        condition = {'recipe__shoppingcart__user__in': user_ids}
+    queryset = RecipeIngredient.objects.filter(**condition)
+    return {
+        (user, ingredient): total
+        for user, ingredient, total in queryset.values_list(
+            'recipe__shoppingcart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+    }
+
+
+def find_drift():
+    """Id пользователей, чьи сохранённые суммы расходятся с пересчётом."""
+    expected = expected_totals()
+    stored = {
+        (user, ingredient): total
+        for user, ingredient, total in
+        ShoppingCartIngredient.objects.values_list(
+            'user', 'ingredient', 'total'
+        )
+    }
+    return {
+        key[0] for key in expected.keys() | stored.keys()
+        if expected.get(key) != stored.get(key)
+    }
+
+
+def rebuild(user_ids):
+    ShoppingCartIngredient.objects.filter(user__in=user_ids).delete()
+    ShoppingCartIngredient.objects.bulk_create(
+        ShoppingCartIngredient(user_id=user, ingredient_id=ingredient,
+                               total=total)
+        for (user, ingredient), total in expected_totals(user_ids).items()
+    )
@@ -0,0 +1,139 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from recipes.autocomplete import reset_index
+from recipes.counters import change_counter
+from recipes.feed import remove as remove_from_feed
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeSimilarity,
+    ShoppingCart,
+    Tag,
+)
+from recipes.reference import tags
+from recipes.shopping_cart import add_recipes, remove_recipes
+from recipes.tasks import (
+    backfill_feed,
+    build_image_variants,
+    delete_image_variants,
+    fan_out_recipe,
+    refresh_similar_lists,
+    refresh_similar_recipes,
+)
+from users.models import Follow
+
+User = get_user_model()
+
+# Массовая загрузка таблицы в обход save(): справочники из файлов,
+# синтетические данные. sender – модель, изменённые строки не известны.
+bulk_loaded = Signal()
+# Избранное, списки покупок и подписки пользователя user_id изменены
+# одним запросом в обход save() и delete() (recipes.bulk). sender –
+# модель, target_ids – id рецептов или авторов изменённых строк.
+rows_changed = Signal()
+
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+}
+
+
+@receiver((post_save, post_delete, bulk_loaded), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    reset_index()
+
+
+@receiver((post_save, post_delete, bulk_loaded), sender=Tag)
+def tag_changed(sender, **kwargs):
+    tags.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        fan_out_recipe.enqueue(instance.id, key=f'fan-out:{instance.id}')
+        refresh_similar_recipes.enqueue(instance.id)
+    if instance.image and (not update_fields or 'image' in update_fields):
+        build_image_variants.enqueue(
+            instance.id, key=f'image-variants:{instance.image.name}'
+        )
+    if update_fields and not {'name', 'text'} & set(update_fields):
+        return
+    Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # Списки, откуда рецепт удалится каскадом, нужно дополнить.
+    listers = list(RecipeSimilarity.objects.filter(
+        similar=instance
+    ).exclude(recipe=instance).values_list('recipe', flat=True))
+    if listers:
+        refresh_similar_lists.enqueue(listers)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+    if instance.image_variants:
+        delete_image_variants.enqueue(
+            instance.image_variants['name'],
+            instance.image_variants['widths'],
+        )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    # Строку состава сохранили отдельно от рецепта (админка): updated_at
+    # сдвигается, чтобы индекс кладовой перечитал рецепт. Удаления
+    # индекс находит сам по числу строк.
+    Recipe.objects.filter(id=instance.recipe_id).update(
+        updated_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def user_recipe_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe, instance.recipe_id, COUNTER_FIELDS[sender], 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def user_recipe_removed(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, COUNTER_FIELDS[sender], -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        add_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_removed(sender, instance, **kwargs):
+    # До удаления: при каскаде от рецепта его состав ещё на месте.
+    remove_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.following_id, 'followers_count', 1)
+        backfill_feed.enqueue(instance.follower_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    change_counter(User, instance.following_id, 'followers_count', -1)
+    remove_from_feed(instance.follower_id, instance.following_id)
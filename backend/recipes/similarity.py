@@ -0,0 +1,226 @@
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from scipy import sparse
+
+from recipes.models import RecipeIngredient, RecipeSimilarity
+
+# Размер плотного блока сходств в ячейках (float32, около 64 МБ).
+BLOCK_CELLS = 16_000_000
+# Ингредиенты не реже чем в такой доле рецептов (соль, масло) общие
+# почти у всех пар: для них пересечения считаются плотным умножением.
+FREQUENT_SHARE = 0.02
+# Столбцов в выборке, по которой оценивается порог топа строки.
+SAMPLE_COLUMNS = 2048
+
+
+def to_matrix(pairs):
+    """Пары (рецепт, ингредиент) в бинарную разреженную матрицу
+    рецепты × ингредиенты; строки упорядочены по id рецепта."""
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    columns = int(pairs[:, 1].max()) + 1 if len(pairs) else 0
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, pairs[:, 1])),
+        shape=(len(ids), columns),
+    )
+    return ids, matrix
+
+
+def load_matrix(queryset=None):
+    if queryset is None:
+        queryset = RecipeIngredient.objects.all()
+    pairs = queryset.order_by().values_list('recipe_id', 'ingredient_id')
+    return to_matrix(np.fromiter(
+        chain.from_iterable(pairs.iterator(chunk_size=10000)),
+        dtype=np.int64,
+    ))
+
+
+class Neighbours:
+    """Коэффициенты Жаккара строк матрицы со всеми остальными строками."""
+
+    def __init__(self, ids, matrix):
+        self.ids = ids
+        self.sizes = np.asarray(matrix.sum(axis=1)).ravel()
+        frequent = np.asarray(matrix.sum(axis=0)).ravel() >= (
+            FREQUENT_SHARE * len(ids)
+        )
+        self.frequent = matrix[:, frequent].tocsr()
+        self.frequent_t = np.ascontiguousarray(
+            self.frequent.T.toarray()
+        )
+        self.rare = matrix[:, ~frequent].tocsr()
+        self.rare_t = self.rare.T.tocsr()
+
+    def position(self, recipe_id):
+        position = int(np.searchsorted(self.ids, recipe_id))
+        if position < len(self.ids) and self.ids[position] == recipe_id:
+            return position
+        return None
+
+    def scores(self, rows):
+        rows = np.asarray(rows)
+        scores = self.frequent[rows].toarray() @ self.frequent_t
+        rare = (self.rare[rows] @ self.rare_t).tocoo()
+        scores[rare.row, rare.col] += rare.data
+        # В матрице только рецепты с ингредиентами: объединение > 0.
+        union = self.sizes[rows, None] + self.sizes[None, :]
+        union -= scores
+        scores /= union
+        scores[np.arange(len(rows)), rows] = 0
+        return scores
+
+    def top(self, rows, limit):
+        """(id, [(id соседа, сходство), ...]) по убыванию сходства,
+        только ненулевые, не более limit на рецепт."""
+        block = max(1, BLOCK_CELLS // max(1, len(self.ids)))
+        for start in range(0, len(rows), block):
+            chunk = rows[start:start + block]
+            scores = self.scores(chunk)
+            for row, (columns, values) in zip(chunk, best(scores, limit)):
+                yield int(self.ids[row]), [
+                    (int(self.ids[column]), round(float(value), 6))
+                    for column, value in zip(columns, values) if value > 0
+                ]
+
+
+def best(scores, limit):
+    """Столбцы и значения limit наибольших элементов каждой строки.
+
+    limit-й максимум выборки столбцов – нижняя граница limit-го
+    максимума строки, так что частичная сортировка идёт только по
+    прошедшим эту границу элементам, а не по всей строке.
+    """
+    sample = scores[:, ::max(1, scores.shape[1] // SAMPLE_COLUMNS)]
+    if 0 < limit < sample.shape[1]:
+        bounds = np.partition(sample, -limit, axis=1)[:, -limit]
+    else:
+        bounds = np.zeros(len(scores), dtype=scores.dtype)
+    for row, bound in zip(scores, bounds):
+        columns = np.flatnonzero(row >= bound)
+        values = row[columns]
+        if len(columns) > limit:
+            top = np.argpartition(values, len(values) - limit)[-limit:]
+            columns, values = columns[top], values[top]
+        order = np.argsort(-values, kind='stable')
+        yield columns[order], values[order]
+
+
+def save(neighbours, recipe_ids=None, batch_size=5000):
+    """Заменяет списки соседей рецептов recipe_ids (всех – если None)."""
+    queryset = RecipeSimilarity.objects.all()
+    if recipe_ids is not None:
+        queryset = queryset.filter(recipe__in=recipe_ids)
+    queryset.delete()
+    RecipeSimilarity.objects.bulk_create(
+        (
+            RecipeSimilarity(recipe_id=recipe, similar_id=similar, score=score)
+            for recipe, similar_list in neighbours
+            for similar, score in similar_list
+        ),
+        batch_size=batch_size,
+    )
+
+
+@transaction.atomic
+def rebuild(limit=None):
+    ids, matrix = load_matrix()
+    neighbours = Neighbours(ids, matrix)
+    save(neighbours.top(
+        range(len(ids)), limit or settings.SIMILAR_RECIPES_LIMIT
+    ))
+    return len(ids)
+
+
+def related(recipe_ids):
+    """Рецепты, у которых есть общий ингредиент с recipe_ids: только
+    у них сходство может быть ненулевым."""
+    return RecipeIngredient.objects.filter(
+        ingredient__in=RecipeIngredient.objects.filter(
+            recipe__in=recipe_ids
+        ).values('ingredient')
+    ).values('recipe')
+
+
+def recompute(recipe_ids, limit):
+    ids, matrix = load_matrix(
+        RecipeIngredient.objects.filter(recipe__in=related(recipe_ids))
+    )
+    neighbours = Neighbours(ids, matrix)
+    rows = [
+        position for position in map(neighbours.position, recipe_ids)
+        if position is not None
+    ]
+    result = {recipe: [] for recipe in recipe_ids}
+    result.update(neighbours.top(rows, limit))
+    return result
+
+
+@transaction.atomic
+def refresh_lists(recipe_ids, limit=None):
+    """Пересчитывает списки соседей целиком, например после удаления
+    рецепта, который в них входил."""
+    lists = recompute(recipe_ids, limit or settings.SIMILAR_RECIPES_LIMIT)
+    save(lists.items(), list(lists))
+    return len(lists)
+
+
+@transaction.atomic
+def refresh(recipe_id, limit=None):
+    """Обновляет соседей после изменения состава рецепта.
+
+    Пересчитываются строка самого рецепта и его сходство с рецептами,
+    где он мог появиться или поменять место. Целиком пересчитываются
+    только те списки, из которых рецепт выпал: на его место может
+    прийти любой другой.
+    """
+    limit = limit or settings.SIMILAR_RECIPES_LIMIT
+    listers = RecipeSimilarity.objects.filter(
+        similar=recipe_id
+    ).values('recipe')
+    affected = Q(recipe__in=related([recipe_id])) | Q(recipe__in=listers)
+    ids, matrix = load_matrix(RecipeIngredient.objects.filter(affected))
+    neighbours = Neighbours(ids, matrix)
+    position = neighbours.position(recipe_id)
+    changed = {recipe_id: []}
+    scores = {}
+    if position is not None:
+        row = neighbours.scores([position])[0]
+        scores = {
+            int(neighbours.ids[column]): round(float(row[column]), 6)
+            for column in np.flatnonzero(row)
+        }
+        changed.update(neighbours.top([position], limit))
+    stored = {}
+    for recipe, similar, score in RecipeSimilarity.objects.filter(
+        affected
+    ).exclude(recipe=recipe_id).order_by('recipe', '-score').values_list(
+        'recipe', 'similar', 'score'
+    ):
+        stored.setdefault(recipe, []).append((similar, score))
+    stale = []
+    for recipe in stored.keys() | scores.keys():
+        current = stored.get(recipe, [])
+        others = [item for item in current if item[0] != recipe_id]
+        score = scores.get(recipe, 0)
+        if len(others) < len(current) and len(current) >= limit and (
+            not score or (others and score < others[-1][1])
+        ):
+            stale.append(recipe)
+            continue
+        if len(others) == len(current) and (
+            not score
+            or len(current) >= limit and score <= current[-1][1]
+        ):
+            continue
+        if score:
+            others.append((recipe_id, score))
+        changed[recipe] = sorted(others, key=lambda item: -item[1])[:limit]
+    if stale:
+        changed.update(recompute(stale, limit))
+    save(changed.items(), list(changed))
+    return len(changed)
@@ -0,0 +1,120 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from jobs.queue import task
+from recipes import feed, similarity, trending
+from recipes.counters import recount
+from recipes.images import build_variants, delete_variants
+from recipes.models import Recipe
+from recipes.shopping_cart import find_drift, rebuild
+from recipes.versions import bump_versions
+from users.models import Follow
+
+
+@task(priority=10)
+def build_image_variants(recipe_id):
+    """Создаёт копии изображения и записывает их в image_variants.
+
+    Запись обновляется, только если изображение не сменили, пока
+    строились копии; копии, которых в новой записи нет, удаляются.
+    """
+    recipe = Recipe.objects.only('image', 'image_variants').filter(
+        id=recipe_id
+    ).first()
+    image = recipe.image if recipe else None
+    if not image or not image.storage.exists(image.name):
+        return 0
+    created, widths = build_variants(image)
+    previous = recipe.image_variants
+    current = {'name': image.name, 'widths': widths}
+    if previous == current or not Recipe.objects.filter(
+        id=recipe_id, image=image.name
+    ).update(image_variants=current):
+        return created
+    stale = previous.get('widths', [])
+    if previous.get('name') == image.name:
+        stale = set(stale) - set(current['widths'])
+    if stale:
+        delete_image_variants(previous['name'], sorted(stale))
+    bump_versions(['recipes', f'recipe:{recipe_id}'])
+    return created
+
+
+@task()
+def delete_image_variants(name, widths):
+    # Копии общего с другими рецептами изображения остаются.
+    if Recipe.objects.filter(image=name).exists():
+        return 0
+    delete_variants(Recipe(image=name).image.storage, name, widths)
+    return len(widths)
+
+
+@task(priority=5)
+def fan_out_recipe(recipe_id):
+    recipe = Recipe.objects.select_related('author').filter(
+        id=recipe_id
+    ).first()
+    return feed.fan_out(recipe) if recipe else 0
+
+
+@task(priority=5)
+def backfill_feed(follower_id, author_id):
+    # Подписку могли отменить, пока задача ждала в очереди.
+    follow = Follow.objects.select_related('following').filter(
+        follower=follower_id, following=author_id
+    ).first()
+    return feed.backfill(follower_id, follow.following) if follow else 0
+
+
+@task(priority=5)
+def backfill_feeds(follower_id, author_ids):
+    return sum(
+        feed.backfill(follower_id, follow.following)
+        for follow in Follow.objects.select_related('following').filter(
+            follower=follower_id, following__in=author_ids
+        )
+    )
+
+
+@task()
+def refresh_similar_recipes(recipe_id):
+    return similarity.refresh(recipe_id)
+
+
+@task()
+def refresh_similar_lists(recipe_ids):
+    return similarity.refresh_lists(recipe_ids)
+
+
+@task()
+def recount_counters():
+    with transaction.atomic():
+        return recount()
+
+
+@task()
+def fix_shopping_carts():
+    with transaction.atomic():
+        users = find_drift()
+        rebuild(users)
+    return len(users)
+
+
+@task(priority=1)
+def update_trending_scores():
+    # Следующий запуск ставится до расчёта: ошибка не рвёт цепочку.
+    schedule_trending_update()
+    return trending.update()
+
+
+def schedule_trending_update():
+    """Ставит обновление трендов на начало следующего интервала
+    TRENDING_INTERVAL. Ключ с номером интервала не даёт цепочке
+    раздвоиться при повторном запуске."""
+    interval = settings.TRENDING_INTERVAL
+    slot = int(time.time() // interval) + 1
+    return update_trending_scores.enqueue(
+        key=f'trending:{slot}', countdown=slot * interval - time.time()
+    )
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.versions import bump_version
+
+# Добавления старше стольких периодов полураспада весят меньше 1/256
+# и не учитываются.
+HALF_LIVES_IN_WINDOW = 8
+
+
+def weights():
+    return (
+        (Favorite, settings.TRENDING_FAVORITE_WEIGHT),
+        (ShoppingCart, settings.TRENDING_SHOPPING_CART_WEIGHT),
+    )
+
+
+def scores(now=None):
+    """Сумма весов добавлений в избранное и списки покупок, каждое
+    затухает вдвое за TRENDING_HALF_LIFE часов.
+
+    Добавления сгруппированы по часам в БД: строк в выборке не больше,
+    чем рецептов с добавлениями на число часов в окне.
+    """
+    now = now or timezone.now()
+    half_life = timedelta(hours=settings.TRENDING_HALF_LIFE)
+    since = now - half_life * HALF_LIVES_IN_WINDOW
+    result = {}
+    for model, weight in weights():
+        buckets = model.objects.filter(created_at__gte=since).annotate(
+            hour=TruncHour('created_at')
+        ).order_by().values('recipe', 'hour').annotate(
+            count=Count('id')
+        ).values_list('recipe', 'hour', 'count')
+        for recipe, hour, count in buckets.iterator():
+            # Середина часа: среднее время добавления в группе.
+            age = now - hour - timedelta(minutes=30)
+            result[recipe] = result.get(recipe, 0) + (
+                weight * count * 0.5 ** (age / half_life)
+            )
+    return {recipe: round(score, 6) for recipe, score in result.items()}
+
+
+def update(now=None, batch_size=1000):
+    """Записывает новые значения trending_score, возвращает число
+    изменённых рецептов."""
+    new = scores(now)
+    with transaction.atomic():
+        old = dict(Recipe.objects.filter(trending_score__gt=0).values_list(
+            'id', 'trending_score'
+        ))
+        changed = [
+            Recipe(id=recipe, trending_score=new.get(recipe, 0))
+            for recipe in old.keys() | new.keys()
+            if old.get(recipe) != new.get(recipe, 0)
+        ]
+        Recipe.objects.bulk_update(
+            changed, ('trending_score',), batch_size=batch_size
+        )
+    if changed:
+        bump_version()
+    return len(changed)
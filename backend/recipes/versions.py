@@ -0,0 +1,31 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_version(name='recipes'):
+    """Версия данных – время последнего изменения в наносекундах."""
+    # После вытеснения ключа версия не вернётся к уже выданной.
+    cache.add(f'{name}:version', time.time_ns(), timeout=None)
+    return cache.get(f'{name}:version')
+
+
+def bump_version(name='recipes'):
+    cache.set(f'{name}:version', time.time_ns(), timeout=None)
+
+
+def get_versions(names):
+    """Версии нескольких данных одним обращением к кешу."""
+    keys = [f'{name}:version' for name in names]
+    found = cache.get_many(keys)
+    return [
+        found[key] if key in found else get_version(name)
+        for name, key in zip(names, keys)
+    ]
+
+
+def bump_versions(names):
+    now = time.time_ns()
+    cache.set_many(
+        {f'{name}:version': now for name in names}, timeout=None
+    )
@@ -12,6 +12,8 @@ class UserAdmin(admin.ModelAdmin):
         'password',
         'first_name',
         'last_name',
+        'recipes_count',
+        'followers_count',
     )
     search_fields = ('username', 'email')
     list_filter = ('username', 'email')
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    User = apps.get_model('users', 'User')
+    duplicates = Follow.objects.values('follower', 'following').annotate(
+        first=Min('id'), count=Count('id')
+    ).filter(count__gt=1)
+    authors = set()
+    for row in duplicates:
+        Follow.objects.filter(
+            follower=row['follower'], following=row['following']
+        ).exclude(id=row['first']).delete()
+        authors.add(row['following'])
+    User.objects.filter(pk__in=authors).update(followers_count=Coalesce(
+        Subquery(
+            Follow.objects.filter(following=OuterRef('pk')).order_by()
+            .values('following').annotate(total=Count('pk')).values('total')
+        ),
+        0,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('follower', 'following'), name='unique_subscription'),
+        ),
+    ]
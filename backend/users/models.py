@@ -5,7 +5,27 @@ from django.db import models
 from users.validators import ValidateUsername
 
 
-class User(ValidateUsername, AbstractUser):
+class DenormalizedFieldsMixin:
+    """Поля denormalized_fields меняются только через update() с
+    F-выражениями. Полный save() существующей строки их не пишет, иначе
+    устаревшее значение в памяти затёрло бы параллельные изменения;
+    записать их можно, только назвав в update_fields."""
+
+    denormalized_fields = ()
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is None and not self._state.adding:
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.denormalized_fields
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+
+class User(DenormalizedFieldsMixin, ValidateUsername, AbstractUser):
+    denormalized_fields = ('recipes_count', 'followers_count')
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('first_name', 'last_name', 'username')
 
@@ -18,6 +38,16 @@ class User(ValidateUsername, AbstractUser):
         unique=True,
         max_length=settings.MAX_LENGTH_IN_NAME,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -55,6 +85,10 @@ class Follow(models.Model):
 
     class Meta:
         constraints = [
+            models.UniqueConstraint(
+                fields=('follower', 'following'),
+                name='unique_subscription',
+            ),
             models.CheckConstraint(
                 check=~models.Q(follower=models.F('following')),
                 name='no_self_subscription',